@@ -1,16 +1,48 @@
-from utils.llm_router import LLM
+from utils.llm_router import create_llm
+from utils.patch import failing_files, merge_files
+from utils.tokens import compact_files, compact_issues, max_output_tokens
+from utils.prompts import template
 import json
 
+BACKEND_PROMPT = template("backend", "2", f"""
+    You are the Backend Engineer Agent.
+    Your task is to generate a backend service as described in the specification.
+
+    RULES:
+    - Use FastAPI (preferred) or Express only if asked.
+    - SQL schema is for reference ONLY.
+    - DO NOT output SQL, markdown, or code blocks.
+    - DO NOT include explanations or comments.
+    - OUTPUT MUST BE VALID JSON ONLY.
+    - Include proper error handling.
+    - Follow clean architecture principles.
+    - DO NOT include explanations. Only return the JSON response.
+    - The whole JSON response MUST fit in {max_output_tokens("code")} tokens.
+
+    The SPECIFICATION is given in the user message.
+
+    OUTPUT FORMAT (MANDATORY):
+    {{
+      "files": [
+        {{"path": "backend/app/main.py", "content": "import fastapi..."}},
+        {{"path": "backend/app/routes/example.py", "content": "..."}}
+      ]
+    }}
+
+    Only return valid JSON.
+""")
+
 class BackendAgent:
-    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",specs=None):
+    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",specs=None, on_token=None):
         self.llm_provider = llm_provider
         self.model = model
-        self.llm = LLM(llm_provider, model)
+        self.llm = create_llm("code", llm_provider, model)
+        self.on_token = on_token
         self.specs = specs
 
-    async def generate_code(self):
-        prompt = self.system_prompt()
-        response = await self.llm.chat(prompt)
+    async def generate_code(self, on_file=None):
+        prompt = self.prompt()
+        response = await self.llm.chat(prompt, on_token=self.on_token, on_file=on_file)
         try:
             result = json.loads(response)
         except:
@@ -18,57 +50,37 @@ class BackendAgent:
         
         return result
 
-    def system_prompt(self)->str:
-        return f"""
-        You are a backend developer. You are given the following specifications:You are the Backend Engineer Agent.
-        Your task is to generate a backend service as described in the specification.
-
-        RULES:
-        - Use FastAPI (preferred) or Express only if asked.
-        - SQL schema is for reference ONLY.
-        - DO NOT output SQL, markdown, or code blocks.
-        - DO NOT include explanations or comments.
-        - OUTPUT MUST BE VALID JSON ONLY.
-        - Include proper error handling.
-        - Follow clean architecture principles.
-        - DO NOT include explanations. Only return the JSON response.
-
+    def prompt(self):
+        return BACKEND_PROMPT.render(f"""
         SPECIFICATION:
         {self.specs}
-        OUTPUT FORMAT (MANDATORY):
-        {{
-          "files": [
-            {{"path": "backend/app/main.py", "content": "import fastapi..."}},
-            {{"path": "backend/app/routes/example.py", "content": "..."}}
-          ]
-        }}
+        """)
 
-        Only return valid JSON.
+    async def fix_code(self, review_report: list, code: dict)->dict:
+        failing_code, issues = failing_files(code, review_report)
+        if not failing_code["files"]:
+            return code
 
-        """
-
-    async def fix_code(self, review_report: dict, code)->dict:
-        system_prompt = self.system_prompt()
-            
-        prompt = f"""
-        {system_prompt}
-        The reviewer found issues in your backend code.
-        Fix the backend code accordingly.
-
-        SPEC:
+        # Same system message as generation, so the cached prefix is reused
+        prompt = BACKEND_PROMPT.render(f"""
+        SPECIFICATION:
         {self.specs}
 
-        Code:
-        {code}
+        The reviewer found critical issues in some of your backend files.
+        Fix ONLY the files listed below.
+        Return ONLY the fixed files, using the same paths, in the OUTPUT FORMAT above.
+        Do NOT return files that are not listed below.
+
+        Failing Files:
+        {compact_files(failing_code["files"])}
 
-        Review Report:
-        {review_report}
-        """
-        response = await self.llm.chat(prompt)
+        Critical Issues:
+        {compact_issues(issues)}
+        """)
+        response = await self.llm.chat(prompt, on_token=self.on_token)
         try:
             result = json.loads(response)
         except:
             raise ValueError("BackendAgent returned invalid JSON during fix cycle.")
-        
-        
-        return result
\ No newline at end of file
+
+        return merge_files(code, result)
@@ -1,16 +1,69 @@
-from utils.llm_router import LLM
+from utils.llm_router import create_llm
+from utils.tokens import compact_files, DOC_CODE_TOKENS
+from utils.prompts import template
 import json
 
+BACKEND_DOC_PROMPT = template("backend_doc", "2", """
+    You are a Senior Backend Engineer and Technical Writer.
+
+    Your task is to produce **formal technical documentation** for a backend system.
+
+    RULES:
+    - This is NOT a code generation task.
+    - Write in a professional, technical tone.
+    - Be concise, structured, and implementation-focused.
+    - Do NOT include markdown.
+    - Do NOT include explanations outside the JSON.
+    - Output MUST be valid JSON.
+    - Do NOT wrap the response in backticks.
+
+    DOCUMENTATION SHOULD INCLUDE:
+    - System overview
+    - Architecture description (layers, modules, services)
+    - Technology stack (language, frameworks, database, caching, messaging, etc.)
+    - API design and endpoints
+    - Data models and database schema overview
+    - Authentication and authorization strategies
+    - Error handling and logging
+    - Deployment, scaling, and monitoring notes
+    - Key design decisions and trade-offs
+
+    The CODE to document is given in the user message.
+
+    OUTPUT FORMAT (MANDATORY):
+    {
+    "title": "Backend Technical Documentation",
+    "sections": [
+        {
+        "heading": "System Overview",
+        "content": [
+            "Paragraph 1",
+            "Paragraph 2"
+        ]
+        },
+        {
+        "heading": "Architecture",
+        "content": [
+            "Paragraph 1"
+        ]
+        }
+    ]
+    }
+
+    Only return valid JSON.
+""")
+
 class BackendDocAgent:
-    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",code=None):
+    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",code=None, on_token=None):
         self.llm_provider = llm_provider
         self.model = model
-        self.llm = LLM(llm_provider, model)
+        self.llm = create_llm("doc", llm_provider, model)
+        self.on_token = on_token
         self.code = code
 
     async def generate_docs(self):
-        prompt = self.system_prompt()
-        response = await self.llm.chat(prompt)
+        prompt = self.prompt()
+        response = await self.llm.chat(prompt, on_token=self.on_token)
 
         try:
             result = json.loads(response)
@@ -19,52 +72,8 @@ class BackendDocAgent:
 
         return result
 
-    def system_prompt(self) -> str:
-        return f"""
-        You are a Senior Backend Engineer and Technical Writer.
-
-        Your task is to produce **formal technical documentation** for a backend system.
-
-        RULES:
-        - This is NOT a code generation task.
-        - Write in a professional, technical tone.
-        - Be concise, structured, and implementation-focused.
-        - Do NOT include markdown.
-        - Do NOT include explanations outside the JSON.
-        - Output MUST be valid JSON.
-        - Do NOT wrap the response in backticks.
-
-        DOCUMENTATION SHOULD INCLUDE:
-        - System overview
-        - Architecture description (layers, modules, services)
-        - Technology stack (language, frameworks, database, caching, messaging, etc.)
-        - API design and endpoints
-        - Data models and database schema overview
-        - Authentication and authorization strategies
-        - Error handling and logging
-        - Deployment, scaling, and monitoring notes
-        - Key design decisions and trade-offs
-
-        OUTPUT FORMAT (MANDATORY):
-        {{
-        "title": "Backend Technical Documentation",
-        "sections": [
-            {{
-            "heading": "System Overview",
-            "content": [
-                "Paragraph 1",
-                "Paragraph 2"
-            ]
-            }},
-            {{
-            "heading": "Architecture",
-            "content": [
-                "Paragraph 1"
-            ]
-            }}
-        ]
-        }}
-
-
-        Only return valid JSON.
-        """
+    def prompt(self):
+        return BACKEND_DOC_PROMPT.render(f"""
+        CODE:
+        {compact_files(self.code.get("files", []), DOC_CODE_TOKENS) if self.code else ""}
+        """)
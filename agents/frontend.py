@@ -1,16 +1,61 @@
-from utils.llm_router import LLM
+from utils.llm_router import create_llm
+from utils.patch import failing_files, merge_files
+from utils.tokens import compact_files, compact_issues, max_output_tokens
+from utils.prompts import template
 import json
 
+FRONTEND_PROMPT = template("frontend", "2", f"""
+    You are the Frontend Engineer Agent.
+
+    Your task is to generate a frontend application based on the specification given in the user message.
+
+    RULES:
+    - Implement ONLY a minimal UI required to verify API integration.
+    - Use a single page with basic form inputs and simple lists.
+    - Do NOT include charts, dialogs, modals, tabs, or advanced UI components.
+    - Avoid third-party visualization libraries (e.g., recharts).
+    - Prefer plain JSX + basic layout over UI-heavy abstractions.
+    - Use React with TypeScript unless otherwise specified.
+    - Prefer modern tools (Vite, React hooks, functional components).
+    - Use clean, readable, production-quality code.
+    - Organize code into components, pages, services, and utilities where appropriate.
+    - Do NOT include backend code.
+    - Do NOT include explanations, comments outside code, or markdown.
+    - Only output the requested files.
+    - Output MUST be valid JSON.
+    - Do NOT wrap the response in triple backticks.
+    - Do NOT include any text before or after the JSON.
+    - If the implementation would exceed a reasonable file size, simplify the solution instead of adding features.
+    - The whole JSON response MUST fit in {max_output_tokens("code")} tokens, even if you need to fix something, find work arounds, THIS IS A MVP
+
+    OUTPUT FORMAT (MANDATORY):
+    {{
+    "files": [
+        {{
+        "path": "frontend/src/main.tsx",
+        "content": "import React from 'react'..."
+        }},
+        {{
+        "path": "frontend/src/App.tsx",
+        "content": "export default function App() {{ ... }}"
+        }}
+    ]
+    }}
+
+    Only return valid JSON.
+""")
+
 class FrontendAgent:
-    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",specs=None):
+    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",specs=None, on_token=None):
         self.llm_provider = llm_provider
         self.model = model
-        self.llm = LLM(llm_provider, model)
+        self.llm = create_llm("code", llm_provider, model)
+        self.on_token = on_token
         self.specs = specs
 
-    async def generate_code(self):
-        prompt = self.system_prompt()
-        response = await self.llm.chat(prompt)
+    async def generate_code(self, on_file=None):
+        prompt = self.prompt()
+        response = await self.llm.chat(prompt, on_token=self.on_token, on_file=on_file)
         try:
             result = json.loads(response)
         except:
@@ -18,75 +63,37 @@ class FrontendAgent:
         
         return result
 
-    def system_prompt(self) -> str:
-        return f"""
-        You are the Frontend Engineer Agent.
-
-        Your task is to generate a frontend application based on the given specification.
-
-        RULES:
-        - Implement ONLY a minimal UI required to verify API integration.
-        - Use a single page with basic form inputs and simple lists.
-        - Do NOT include charts, dialogs, modals, tabs, or advanced UI components.
-        - Avoid third-party visualization libraries (e.g., recharts).
-        - Prefer plain JSX + basic layout over UI-heavy abstractions.
-        - Use React with TypeScript unless otherwise specified.
-        - Prefer modern tools (Vite, React hooks, functional components).
-        - Use clean, readable, production-quality code.
-        - Organize code into components, pages, services, and utilities where appropriate.
-        - Do NOT include backend code.
-        - Do NOT include explanations, comments outside code, or markdown.
-        - Only output the requested files.
-        - Output MUST be valid JSON.
-        - Do NOT wrap the response in triple backticks.
-        - Do NOT include any text before or after the JSON.
-        - If the implementation would exceed a reasonable file size, simplify the solution instead of adding features.
-        -DO NOT EXCEED 1000 words in the JSON no matter what, even if you need to fix something, find work arounds, THIS IS A MVP
-
-
+    def prompt(self):
+        return FRONTEND_PROMPT.render(f"""
         SPECIFICATION:
         {self.specs}
+        """)
 
-        OUTPUT FORMAT (MANDATORY):
-        {{
-        "files": [
-            {{
-            "path": "frontend/src/main.tsx",
-            "content": "import React from 'react'..."
-            }},
-            {{
-            "path": "frontend/src/App.tsx",
-            "content": "export default function App() {{ ... }}"
-            }}
-        ]
-        }}
-
-        Only return valid JSON.
-        """
-
-    async def fix_code(self, review_report: dict,code)->dict:
-        system_prompt = self.system_prompt()
-            
-        prompt = f"""
-        {system_prompt}
-        The reviewer found issues in your frontend code.
-        Fix the frontend code accordingly.
+    async def fix_code(self, review_report: list, code: dict)->dict:
+        failing_code, issues = failing_files(code, review_report)
+        if not failing_code["files"]:
+            return code
 
-        SPEC:
+        # Same system message as generation, so the cached prefix is reused
+        prompt = FRONTEND_PROMPT.render(f"""
+        SPECIFICATION:
         {self.specs}
 
-        Code:
-        {code}
+        The reviewer found critical issues in some of your frontend files.
+        Fix ONLY the files listed below.
+        Return ONLY the fixed files, using the same paths, in the OUTPUT FORMAT above.
+        Do NOT return files that are not listed below.
 
-        Review Report:
-        {review_report}
-        """
+        Failing Files:
+        {compact_files(failing_code["files"])}
 
-        response = await self.llm.chat(prompt)
+        Critical Issues:
+        {compact_issues(issues)}
+        """)
+        response = await self.llm.chat(prompt, on_token=self.on_token)
         try:
             result = json.loads(response)
         except:
-            raise ValueError("BackendAgent returned invalid JSON during fix cycle.")
-        
-        
-        return result
+            raise ValueError("FrontendAgent returned invalid JSON during fix cycle.")
+
+        return merge_files(code, result)
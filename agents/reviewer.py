@@ -1,80 +1,312 @@
-from utils.llm_router import LLM
-import json
+from utils.llm_router import create_llm
+from utils.tracing import span
+from utils.tokens import count_tokens
+from utils.checks import run_checks
+from utils.prompts import template
+import asyncio
+import hashlib
 import json
+import os
+
+REVIEW_CONCURRENCY = int(os.getenv("REVIEW_CONCURRENCY", "8"))
+# Code tokens packed into one multi-file review call (0 = one file per call)
+REVIEW_BATCH_TOKENS = int(os.getenv("REVIEW_BATCH_TOKENS", "3000"))
+REVIEW_BATCH_MAX_FILES = int(os.getenv("REVIEW_BATCH_MAX_FILES", "6"))
+
+# Instructions shared by the single-file and batched review prompts
+REVIEW_RULES = """
+    SEVERITY RULES:
+    - critical: causes runtime error, crash, data loss, security issue, or incorrect behavior
+    - major: likely bug or incorrect behavior in edge cases
+    - minor: style issues, best practices, deprecations, readability
+
+    STATUS RULES:
+    - status MUST be "fail" if and only if at least one issue has severity "critical"
+    - otherwise status MUST be "pass"
+"""
+
+REVIEW_PROMPT = template("review", "2", f"""
+    You are a strict code reviewer.
+
+    You will review EXACTLY ONE source file, given in the user message.
+
+    RULES:
+    - Review only the code provided.
+    - Do NOT reference other files or project context.
+    - Return ONLY valid JSON.
+    - Do NOT include explanations, markdown, or extra text.
+
+    OUTPUT FORMAT:
+    Return a single JSON object representing the review result for this file.
+
+    The object MUST contain:
+    - "path": string (file path, exactly as given)
+    - "status": "pass" or "fail"
+    - "issues": array of issue objects
+
+    Each issue object MUST contain:
+    - "type": "review"
+    - "message": concise description of the issue
+    - "line": integer (1-based) or null if unknown
+    - "severity": defines how severe the issue
+
+    If no issues are found, return an empty issues array.
+    {REVIEW_RULES}
+    VALID OUTPUT EXAMPLE:
+    {{
+    "path": "backend/app/main.py",
+    "status": "pass",
+    "issues": []
+    }}
+
+    IMPORTANT:
+    - Output MUST be valid JSON.
+    - Do NOT stringify JSON.
+    - Do NOT escape quotes.
+""")
+
+BATCH_REVIEW_PROMPT = template("review_batch", "2", f"""
+    You are a strict code reviewer.
+
+    You will review several source files, given in the user message. Review each file independently.
+
+    RULES:
+    - Review only the code provided.
+    - Do NOT reference other files or project context.
+    - Return ONLY valid JSON.
+    - Do NOT include explanations, markdown, or extra text.
+
+    OUTPUT FORMAT:
+    Return a JSON object with a "files" array holding one review result per file,
+    in the same order as the files in the user message.
+
+    Each review result MUST contain:
+    - "path": string (file path, exactly as given)
+    - "status": "pass" or "fail"
+    - "issues": array of issue objects
+
+    Each issue object MUST contain:
+    - "type": "review"
+    - "message": concise description of the issue
+    - "line": integer (1-based, within that file) or null if unknown
+    - "severity": defines how severe the issue
+
+    If no issues are found in a file, return an empty issues array for it.
+    {REVIEW_RULES}
+    VALID OUTPUT EXAMPLE:
+    {{
+    "files": [
+        {{"path": "backend/app/main.py", "status": "pass", "issues": []}}
+    ]
+    }}
+
+    IMPORTANT:
+    - Output MUST be valid JSON.
+    - Do NOT stringify JSON.
+    - Do NOT escape quotes.
+""")
+
+
+def pack_batches(files, budget, max_files):
+    """
+    First-fit decreasing bin packing of files by token count.
+    Files larger than the budget end up alone in their batch.
+    """
+    sized = sorted(files, key=lambda file: count_tokens(file["content"]), reverse=True)
+    batches = []
+    for file in sized:
+        tokens = count_tokens(file["content"])
+        for batch in batches:
+            if batch["tokens"] + tokens <= budget and len(batch["files"]) < max_files:
+                batch["files"].append(file)
+                batch["tokens"] += tokens
+                break
+        else:
+            batches.append({"files": [file], "tokens": tokens})
+    return [batch["files"] for batch in batches]
+
+
+def valid_verdict(verdict) -> bool:
+    return (
+        isinstance(verdict, dict)
+        and verdict.get("status") in ("pass", "fail")
+        and isinstance(verdict.get("issues", []), list)
+    )
+
+
+def error_verdict(path, message) -> dict:
+    """
+    Failing verdict for a file whose review call did not produce a usable result.
+    """
+    return {
+        "path": path,
+        "status": "fail",
+        "issues": [{
+            "type": "error",
+            "message": message,
+            "line": None,
+            "severity": "critical",
+        }],
+    }
+
 
 class ReviewerAgent:
-    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",code=None):
+    # Part of every cache key, so cached verdicts are invalidated with the prompts
+    PROMPT_VERSION = f"{REVIEW_PROMPT.version}/{BATCH_REVIEW_PROMPT.version}"
+
+    def __init__(self, llm_provider="deepseek", model ="deepseek-chat",code=None, max_concurrency=REVIEW_CONCURRENCY, cache=None, on_verdict=None, batch_tokens=REVIEW_BATCH_TOKENS):
         self.llm_provider = llm_provider
         self.model = model
-        self.llm = LLM(llm_provider, model)
+        self.llm = create_llm("review", llm_provider, model)
         self.code_content = code
+        # (path, content hash, prompt version) -> verdict, shared across revisions
+        self.cache = cache if cache is not None else {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Optional async callback receiving each file verdict as it completes
+        self.on_verdict = on_verdict
+        # Pack small files into multi-file calls up to this many code tokens
+        self.batch_tokens = batch_tokens
     
     async def review(self):
         files = self.code_content["files"]
-        review = {
-            "files": []
+        verdicts = await self.review_files(files)
+        return {
+            "files": [verdicts[file["path"]] for file in files]
         }
-        for file in files:
-            path = file["path"]
-            content = file["content"]
-            prompt = self.system_prompt(content,path)
-            llm_response = await self.llm.chat(prompt)
-            if isinstance(llm_response, str):
-                llm_response = json.loads(llm_response)
 
-            review["files"].append(llm_response)
-        
-        return review
+    async def review_files(self, files) -> dict:
+        """
+        Review files and return {path: verdict}. Files failing the local
+        checks get their verdict without an LLM call; uncached files are
+        packed into multi-file calls when batching is enabled.
+        """
+        # Missing-import checks need the full file set, unknown while streaming
+        paths = [file["path"] for file in self.code_content["files"]] if self.code_content else None
+        with span("review.local", files=len(files)) as local_span:
+            failed = await run_checks(files, paths)
+            local_span.set("failed", len(failed))
+        for verdict in failed.values():
+            if self.on_verdict is not None:
+                await self.on_verdict(verdict)
 
-    def system_prompt(self, code: str,path: str) -> str:
-        return f"""
-            You are a strict code reviewer.
+        single = []
+        pending = []
+        for file in files:
+            if file["path"] in failed:
+                continue
+            if self.batch_tokens > 0 and self.cache_key(file["path"], file["content"]) not in self.cache:
+                pending.append(file)
+            else:
+                single.append(file)
 
-            You will review EXACTLY ONE source file.
+        batches = pack_batches(pending, self.batch_tokens, REVIEW_BATCH_MAX_FILES)
+        results = await asyncio.gather(
+            *(self.review_and_report(file) for file in single),
+            *(self.review_batch(batch) for batch in batches)
+        )
+        verdicts = dict(failed)
+        verdicts.update({file["path"]: verdict for file, verdict in zip(single, results)})
+        for batch_verdicts in results[len(single):]:
+            verdicts.update(batch_verdicts)
+        return verdicts
+
+    async def review_batch(self, files) -> dict:
+        """
+        Review several files in one call; returns {path: verdict}.
+        Files the model skipped, or all of them if the call fails, are
+        reviewed one by one instead.
+        """
+        if len(files) == 1:
+            return {files[0]["path"]: await self.review_and_report(files[0])}
 
-            RULES:
-            - Review only the code provided.
-            - Do NOT reference other files or project context.
-            - Return ONLY valid JSON.
-            - Do NOT include explanations, markdown, or extra text.
+        with span("review.batch", files=len(files)) as batch_span:
+            prompt = self.batch_prompt(files)
+            try:
+                async with self.semaphore:
+                    llm_response = await self.llm.chat(prompt)
+                if isinstance(llm_response, str):
+                    llm_response = json.loads(llm_response)
+                returned = {
+                    verdict["path"]: verdict
+                    for verdict in llm_response.get("files", [])
+                    if valid_verdict(verdict) and "path" in verdict
+                }
+            except Exception as e:
+                batch_span.set("error", str(e))
+                returned = {}
 
-            OUTPUT FORMAT:
-            Return a single JSON object representing the review result for this file.
+            verdicts = {}
+            for file in files:
+                verdict = returned.get(file["path"])
+                if verdict is None:
+                    continue
+                self.cache[self.cache_key(file["path"], file["content"])] = verdict
+                if self.on_verdict is not None:
+                    await self.on_verdict(verdict)
+                verdicts[file["path"]] = verdict
+            batch_span.set("missing", len(files) - len(verdicts))
 
-            The object MUST contain:
-            - "path": string (file path)
-            - "status": "pass" or "fail"
-            - "issues": array of issue objects
+        missing = [file for file in files if file["path"] not in verdicts]
+        results = await asyncio.gather(*(self.review_and_report(file) for file in missing))
+        verdicts.update({file["path"]: verdict for file, verdict in zip(missing, results)})
+        return verdicts
 
-            Each issue object MUST contain:
-            - "type": "review"
-            - "message": concise description of the issue
-            - "line": integer (1-based) or null if unknown
-            - "severity": defines how severe the issue
+    async def review_and_report(self, file):
+        verdict = await self.review_file(file)
+        if self.on_verdict is not None:
+            await self.on_verdict(verdict)
+        return verdict
 
-            If no issues are found, return an empty issues array.
+    def cache_key(self, path, content):
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return (path, digest, self.PROMPT_VERSION)
 
-            SEVERITY RULES:
-            - critical: causes runtime error, crash, data loss, security issue, or incorrect behavior
-            - major: likely bug or incorrect behavior in edge cases
-            - minor: style issues, best practices, deprecations, readability
+    async def review_file(self, file):
+        path = file["path"]
+        content = file["content"]
+        with span("review.file", path=path, chars=len(content)) as review_span:
+            key = self.cache_key(path, content)
+            if key in self.cache:
+                review_span.set("cache", "hit")
+                verdict = self.cache[key]
+            else:
+                verdict = await self.request_verdict(key, path, content)
+            review_span.set("status", verdict.get("status"))
+            return verdict
 
-            STATUS RULES:
-            - status MUST be "fail" if and only if at least one issue has severity "critical"
-            - otherwise status MUST be "pass"
+    async def request_verdict(self, key, path, content):
+        prompt = self.prompt(content, path)
+        try:
+            async with self.semaphore:
+                llm_response = await self.llm.chat(prompt)
+            if isinstance(llm_response, str):
+                llm_response = json.loads(llm_response)
+        except Exception as e:
+            # Isolate the failure to this file instead of aborting the whole review
+            return error_verdict(path, f"Review failed: {e}")
+        if not valid_verdict(llm_response):
+            # Not cached, so the next revision asks again
+            return error_verdict(path, "Review failed: verdict has no valid status")
+        # The fix step selects failing files by path, so keep ours
+        llm_response["path"] = path
+        self.cache[key] = llm_response
+        return llm_response
 
+    def prompt(self, code: str, path: str):
+        return REVIEW_PROMPT.render(f"""
             CODE (path: "{path}"):
             {code}
+        """)
 
-            VALID OUTPUT EXAMPLE:
-            {{
-            "path": "{path}",
-            "status": "pass",
-            "issues": []
-            }}
-
-            IMPORTANT:
-            - Output MUST be valid JSON.
-            - Do NOT stringify JSON.
-            - Do NOT escape quotes.
-        """
+    def batch_prompt(self, files):
+        code = "\n".join(
+            f"""
+            CODE (path: "{file['path']}"):
+            {file['content']}
+            """
+            for file in files
+        )
+        return BATCH_REVIEW_PROMPT.render(f"""
+            {len(files)} FILES:
+            {code}
+        """)
@@ -0,0 +1,340 @@
+"""
+Deterministic OpenAI-compatible stand-in for benchmarking the pipeline offline.
+
+Run with:
+    python -m bench.mock_llm --port 8100 --latency lognormal:0.8,0.4 --error-rate 0.02
+
+then point a provider at it, e.g. DEEPSEEK_BASE_URL=http://127.0.0.1:8100/v1
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uvicorn
+
+app = FastAPI(title="Mock LLM Server")
+
+config = {
+    # "fixed:s", "uniform:low,high" or "lognormal:median,sigma" (seconds)
+    "latency": "fixed:0.05",
+    # Share of requests answered with 429/500 instead of a completion
+    "error_rate": 0.0,
+    # Share of first-draft files the reviewer fails
+    "review_fail_rate": 0.2,
+    # Share of first-draft files with a syntax error the local checks catch
+    "syntax_error_rate": 0.0,
+    # Files produced per code generation call
+    "files": 4,
+    # Lines per generated file
+    "lines": 20,
+    # Seconds between streamed 64-character chunks (models generate incrementally)
+    "chunk_delay": 0.0,
+    "seed": 0,
+    # Provider request limit per minute; requests over it get a 429 (0 = unlimited)
+    "rpm": 0,
+}
+
+stats = {
+    "requests": 0,
+    "errors": 0,
+    "roles": {},
+    "prompt_chars": 0,
+    "completion_chars": 0,
+    "throttled": 0,
+    "prompt_cache_hit_tokens": 0,
+}
+
+# Arrival times of recent requests, for the rpm limit
+recent = []
+# Digests of system messages seen so far; a repeated one is a prompt cache hit
+prefixes = set()
+
+rng = random.Random(config["seed"])
+
+
+def sample_latency() -> float:
+    kind, _, args = config["latency"].partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return rng.lognormvariate(0, sigma) * median
+    raise ValueError(f"Unknown latency distribution: {config['latency']}")
+
+
+def stable_fraction(*parts) -> float:
+    """
+    Deterministic value in [0, 1) derived from the seed and parts.
+    """
+    digest = hashlib.sha256(json.dumps([config["seed"], *parts]).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 0x100000000
+
+
+def classify(prompt: str) -> str:
+    if "SPECIFICATION CARD" in prompt:
+        return "specs"
+    if "strict code reviewer" in prompt:
+        return "review"
+    if "Technical Writer" in prompt:
+        return "doc"
+    if "Failing Files" in prompt:
+        return "fix"
+    return "code"
+
+
+def spec_card(side: str) -> str:
+    return (
+        "## Overview\n"
+        f"- Minimal {side} for tracking items.\n"
+        "## Functional Requirements\n"
+        "- Create, list, change and delete items.\n"
+        "## Data Models\n"
+        "- TrackedItem\n    - id: string\n    - name: string\n"
+        "## API Contracts\n"
+        "- GET /api/items\n"
+        "## Error Handling\n"
+        "- 404 when an item does not exist\n"
+        "## Output Expectations\n"
+        "- Runs locally\n"
+    )
+
+
+def spec_response(prompt: str) -> str:
+    if "=== BACKEND SPEC ===" in prompt:
+        return (
+            "=== BACKEND SPEC ===\n" + spec_card("backend")
+            + "=== FRONTEND SPEC ===\n" + spec_card("frontend")
+        )
+    side = "backend" if "BACKEND agent" in prompt else "frontend"
+    return spec_card(side)
+
+
+def code_file(path: str, marker: str = "") -> dict:
+    body = "\n".join(f"value_{i} = {i}" for i in range(config["lines"]))
+    return {"path": path, "content": f"{body}\n{marker}"}
+
+
+def code_response(prompt: str) -> str:
+    side = "frontend" if "Frontend Engineer" in prompt else "backend"
+    ext = "tsx" if side == "frontend" else "py"
+    files = []
+    for i in range(config["files"]):
+        path = f"{side}/src/module_{i}.{ext}"
+        broken = stable_fraction("syntax", path) < config["syntax_error_rate"]
+        files.append(code_file(path, "broken = (" if broken else ""))
+    return json.dumps({"files": files})
+
+
+def fix_response(prompt: str) -> str:
+    section = prompt.split("Failing Files", 1)[1]
+    section = section.split("Critical Issues", 1)[0]
+    paths = re.findall(r"""["']path["']\s*:\s*["']([^"']+)["']""", section)
+    files = [code_file(path, "# fixed") for path in dict.fromkeys(paths)]
+    return json.dumps({"files": files})
+
+
+def review_response(prompt: str) -> str:
+    verdicts = []
+    # Split into (path, code) pairs so "# fixed" is checked per file in batched reviews
+    blocks = re.split(r'CODE \(path: "([^"]+)"\)', prompt)[1:]
+    for path, code in list(zip(blocks[::2], blocks[1::2])) or [("unknown", prompt)]:
+        fixed = "# fixed" in code
+        # The model spots syntax errors too, it just costs a review call
+        failed = not fixed and ("broken = (" in code or stable_fraction("review", path) < config["review_fail_rate"])
+        issues = []
+        if failed:
+            issues.append({"type": "review", "message": "Mock failure", "line": 1, "severity": "critical"})
+        verdicts.append({"path": path, "status": "fail" if failed else "pass", "issues": issues})
+    if len(verdicts) == 1:
+        return json.dumps(verdicts[0])
+    return json.dumps({"files": verdicts})
+
+
+def doc_response(prompt: str) -> str:
+    title = "Frontend Technical Documentation" if "frontend" in prompt else "Backend Technical Documentation"
+    return json.dumps({
+        "title": title,
+        "sections": [{"heading": "System Overview", "content": ["Mock documentation."]}],
+    })
+
+
+RESPONDERS = {
+    "specs": spec_response,
+    "code": code_response,
+    "fix": fix_response,
+    "review": review_response,
+    "doc": doc_response,
+}
+
+
+def usage(prompt: str, content: str, cached: int) -> dict:
+    """
+    DeepSeek-style usage, with the prompt cache hit and miss split.
+    """
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": cached,
+        "prompt_cache_miss_tokens": prompt_tokens - cached,
+    }
+
+
+def cached_tokens(messages) -> int:
+    if not messages or messages[0].get("role") != "system":
+        return 0
+    system = messages[0].get("content") or ""
+    digest = hashlib.sha256(system.encode("utf-8")).hexdigest()
+    if digest not in prefixes:
+        prefixes.add(digest)
+        return 0
+    return len(system) // 4
+
+
+def completion(model: str, content: str, prompt: str, cached: int) -> dict:
+    return {
+        "id": f"mock-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage(prompt, content, cached),
+    }
+
+
+async def stream_completion(model: str, content: str, prompt: str, cached: int, include_usage: bool):
+    pieces = [content[i:i + 64] for i in range(0, len(content), 64)]
+    for piece in pieces:
+        chunk = {
+            "id": f"mock-{stats['requests']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(config["chunk_delay"])
+    if include_usage:
+        chunk = {
+            "id": f"mock-{stats['requests']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [],
+            "usage": usage(prompt, content, cached),
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = "\n".join(message.get("content") or "" for message in body["messages"])
+    role = classify(prompt)
+
+    stats["requests"] += 1
+    stats["roles"][role] = stats["roles"].get(role, 0) + 1
+    stats["prompt_chars"] += len(prompt)
+
+    if config["rpm"]:
+        now = time.monotonic()
+        recent[:] = [at for at in recent if at > now - 60]
+        if len(recent) >= config["rpm"]:
+            stats["throttled"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit", "code": 429}},
+                headers={"retry-after": f"{60 - (now - recent[0]):.1f}"},
+            )
+        recent.append(now)
+
+    await asyncio.sleep(sample_latency())
+
+    if rng.random() < config["error_rate"]:
+        stats["errors"] += 1
+        status = rng.choice((429, 500))
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": "Mock failure", "type": "mock_error", "code": status}},
+        )
+
+    content = RESPONDERS[role](prompt)
+    stats["completion_chars"] += len(content)
+    cached = cached_tokens(body["messages"])
+    stats["prompt_cache_hit_tokens"] += cached
+    model = body.get("model", "mock")
+    if body.get("stream"):
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        return StreamingResponse(
+            stream_completion(model, content, prompt, cached, include_usage), media_type="text/event-stream"
+        )
+    # Non-streamed calls still pay the generation time before answering
+    await asyncio.sleep(config["chunk_delay"] * (len(content) // 64 + 1))
+    return completion(model, content, prompt, cached)
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/config")
+async def set_config(request: Request):
+    """Update config and reset counters between benchmark scenarios"""
+    global rng
+    config.update(await request.json())
+    rng = random.Random(config["seed"])
+    stats.update({"requests": 0, "errors": 0, "roles": {}, "prompt_chars": 0, "completion_chars": 0, "throttled": 0, "prompt_cache_hit_tokens": 0})
+    recent.clear()
+    prefixes.clear()
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default=config["latency"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"])
+    parser.add_argument("--review-fail-rate", type=float, default=config["review_fail_rate"])
+    parser.add_argument("--syntax-error-rate", type=float, default=config["syntax_error_rate"])
+    parser.add_argument("--files", type=int, default=config["files"])
+    parser.add_argument("--lines", type=int, default=config["lines"])
+    parser.add_argument("--chunk-delay", type=float, default=config["chunk_delay"])
+    parser.add_argument("--seed", type=int, default=config["seed"])
+    parser.add_argument("--rpm", type=int, default=config["rpm"])
+    args = parser.parse_args()
+
+    global rng
+    config.update({
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "review_fail_rate": args.review_fail_rate,
+        "syntax_error_rate": args.syntax_error_rate,
+        "files": args.files,
+        "lines": args.lines,
+        "chunk_delay": args.chunk_delay,
+        "seed": args.seed,
+        "rpm": args.rpm,
+    })
+    rng = random.Random(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
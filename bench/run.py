@@ -0,0 +1,284 @@
+"""
+Benchmark the orchestration pipeline against the offline mock LLM server.
+
+Examples:
+    python -m bench.run --mode manager --concurrency 1,4,16 --files 2,8
+    python -m bench.run --mode http --concurrency 1,8 --save bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json --tolerance 0.1
+    python -m bench.run --mode http --workers 1,2,4 --concurrency 16 --provider-rpm 600
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 4)
+
+
+def start_process(args, env, url):
+    process = subprocess.Popen(args, cwd=ROOT, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(args)} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{' '.join(args)} did not start")
+
+
+def peak_rss_mb(pid=None):
+    """
+    Peak resident memory in MB for this process, or for pid and its
+    child processes (uvicorn workers) via /proc.
+    """
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    status = Path(f"/proc/{pid}/status")
+    if not status.exists():
+        return None
+    total = 0
+    for line in status.read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            total = int(line.split()[1]) / 1024
+    for children in Path(f"/proc/{pid}/task").glob("*/children"):
+        for child in children.read_text().split():
+            total += peak_rss_mb(int(child)) or 0
+    return total
+
+
+async def run_pipelines(call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(index):
+        nonlocal failures
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                await call(index)
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    return latencies, failures, time.perf_counter() - started_at
+
+
+async def bench_manager(requests, concurrency, key):
+    # Imported late so the provider base URL env vars are already set
+    from manager.manager import ManagerAgent
+
+    async def call(index):
+        # A unique task per request keeps the spec cache out of the measurement
+        await ManagerAgent(f"Benchmark {key} task {index}: track items").run_manager()
+
+    tracemalloc.start()
+    result = await run_pipelines(call, requests, concurrency)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"tracedPeakMb": round(traced_peak / 1024 / 1024, 2), "peakRssMb": round(peak_rss_mb(), 2)}
+
+
+async def bench_http(requests, concurrency, key, server_url, server_pid):
+    async with httpx.AsyncClient(base_url=server_url, timeout=None) as client:
+        async def call(index):
+            response = await client.post(
+                "/api/generate",
+                data={"description": f"Benchmark {key} task {index}: track items"}
+            )
+            response.raise_for_status()
+
+        result = await run_pipelines(call, requests, concurrency)
+    rss = peak_rss_mb(server_pid)
+    return result, {"serverPeakRssMb": round(rss, 2) if rss is not None else None}
+
+
+def scenario_key(mode, concurrency, files, workers=1):
+    key = f"{mode}/c{concurrency}/f{files}"
+    return key if workers == 1 else f"{key}/w{workers}"
+
+
+def summarize(latencies, failures, wall, llm_stats, memory):
+    return {
+        "completed": len(latencies),
+        "failed": failures,
+        "wallSeconds": round(wall, 3),
+        "throughput": round(len(latencies) / wall, 3) if wall else None,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "llmCalls": llm_stats["requests"],
+        "llmErrors": llm_stats["errors"],
+        "llmThrottled": llm_stats["throttled"],
+        "llmCallsByRole": llm_stats["roles"],
+        # Share of prompt tokens the mock served from its prefix cache
+        "promptCacheHitRate": round(llm_stats["prompt_cache_hit_tokens"] / max(1, llm_stats["prompt_chars"] // 4), 3),
+        **memory,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print deltas against a stored baseline; return True if any scenario regressed.
+    """
+    regressed = False
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"{key}: no baseline")
+            continue
+        lines = []
+        for metric, higher_is_better in (("throughput", True), ("p95", False), ("llmCalls", False)):
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            regressed = regressed or worse
+            lines.append(f"{metric} {old} -> {new} ({change:+.1%}){' REGRESSION' if worse else ''}")
+        print(f"{key}: " + "; ".join(lines))
+    return regressed
+
+
+def start_server(env, workers):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server_env = dict(env)
+    state = tempfile.mkdtemp(prefix="bench-state-")
+    server_env.update({
+        "SERVER_WORKERS": str(workers),
+        # Fresh shared state per server so scenarios do not reuse each other's results
+        "STATE_DIR": state,
+        "JOB_STORE_PATH": f"{state}/jobs.sqlite",
+        "CHECKPOINT_STORE_PATH": f"{state}/checkpoints.sqlite",
+        "ARTIFACTS_DIR": f"{state}/runs",
+    })
+    server = start_process(
+        [sys.executable, "-m", "uvicorn", "server:create_app", "--factory", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        server_env,
+        f"{url}/metrics",
+    )
+    return server, url
+
+
+async def run(args):
+    mock_port = free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    env = dict(os.environ)
+    env.update({
+        "DEEPSEEK_BASE_URL": f"{mock_url}/v1",
+        "DEEPSEEK_API_KEY": "mock",
+        "ARTIFACTS_DIR": tempfile.mkdtemp(prefix="bench-runs-"),
+    })
+    if args.provider_rpm:
+        # The client-side limiter gets the same budget the mock provider enforces
+        env["LLM_DEEPSEEK_RPM"] = str(args.provider_rpm)
+    os.environ.update(env)
+
+    mock = start_process(
+        [sys.executable, "-m", "bench.mock_llm", "--port", str(mock_port),
+         "--latency", args.latency, "--error-rate", str(args.error_rate),
+         "--review-fail-rate", str(args.review_fail_rate),
+         "--syntax-error-rate", str(args.syntax_error_rate), "--chunk-delay", str(args.chunk_delay),
+         "--seed", str(args.seed), "--rpm", str(args.provider_rpm)],
+        env,
+        f"{mock_url}/stats",
+    )
+    server = None
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=mock_url) as mock_client:
+            for workers in args.workers if args.mode == "http" else [1]:
+                server_url = None
+                if args.mode == "http":
+                    server, server_url = start_server(env, workers)
+                for files in args.files:
+                    for concurrency in args.concurrency:
+                        await mock_client.post("/config", json={"files": files, "seed": args.seed})
+                        requests = max(concurrency * args.rounds, 1)
+                        key = scenario_key(args.mode, concurrency, files, workers)
+                        if args.mode == "http":
+                            (latencies, failures, wall), memory = await bench_http(requests, concurrency, key, server_url, server.pid)
+                        else:
+                            (latencies, failures, wall), memory = await bench_manager(requests, concurrency, key)
+                        llm_stats = (await mock_client.get("/stats")).json()
+                        results[key] = summarize(latencies, failures, wall, llm_stats, memory)
+                        print(f"{key}: {json.dumps(results[key])}")
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+                    server = None
+    finally:
+        for process in (server, mock):
+            if process is not None:
+                process.terminate()
+                process.wait()
+    return results
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("manager", "http"), default="manager")
+    parser.add_argument("--concurrency", type=parse_list, default=[1, 4, 16])
+    parser.add_argument("--workers", type=parse_list, default=[1], help="server processes to compare (http mode)")
+    parser.add_argument("--files", type=parse_list, default=[4])
+    parser.add_argument("--rounds", type=int, default=2, help="pipelines per unit of concurrency")
+    parser.add_argument("--latency", default="lognormal:0.2,0.3")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--review-fail-rate", type=float, default=0.2)
+    parser.add_argument("--syntax-error-rate", type=float, default=0.0, help="mock share of drafts with syntax errors")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="mock seconds per streamed 64-char chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--provider-rpm", type=int, default=0, help="mock provider request limit per minute (0 = unlimited)")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare results against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+import uuid
+
+from jobs.store import QUEUED, RUNNING, SUCCEEDED, FAILED
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobScheduler:
+    """
+    Runs submitted jobs in the background on a fixed number of workers.
+    Jobs beyond the worker count wait in a bounded queue.
+    """
+
+    def __init__(self, store, runner, workers=4, max_queue=100):
+        self.store = store
+        # runner(payload, job_id) -> awaitable result
+        self.runner = runner
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.tasks = []
+
+    def start(self):
+        for _ in range(self.workers):
+            self.tasks.append(asyncio.create_task(self.worker()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, payload) -> str:
+        if self.queue.full():
+            raise QueueFullError("Job queue is full")
+        job_id = uuid.uuid4().hex
+        await self.store.create(job_id, payload)
+        try:
+            self.queue.put_nowait((job_id, payload))
+        except asyncio.QueueFull:
+            # Another submit filled the queue while the record was written
+            await self.store.delete(job_id)
+            raise QueueFullError("Job queue is full")
+        return job_id
+
+    async def retry(self, job_id, payload):
+        """
+        Queue a failed job again under the same id, so a pipeline with
+        checkpoints resumes where it stopped.
+        """
+        if self.queue.full():
+            raise QueueFullError("Job queue is full")
+        await self.store.update(job_id, status=QUEUED, error=None, started_at=None, finished_at=None, owner=os.getpid())
+        try:
+            self.queue.put_nowait((job_id, payload))
+        except asyncio.QueueFull:
+            await self.store.update(job_id, status=FAILED, error="Job queue is full", finished_at=time.time())
+            raise QueueFullError("Job queue is full")
+
+    async def worker(self):
+        while True:
+            job_id, payload = await self.queue.get()
+            try:
+                await self.run_job(job_id, payload)
+            finally:
+                self.queue.task_done()
+
+    async def run_job(self, job_id, payload):
+        await self.store.update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            result = await self.runner(payload, job_id)
+        except asyncio.CancelledError:
+            await self.store.update(job_id, status=FAILED, error="Cancelled", finished_at=time.time())
+            # Only stop when this worker is being cancelled; a cancellation
+            # raised by the runner itself just fails the job
+            if asyncio.current_task().cancelling():
+                raise
+        except Exception as e:
+            await self.store.update(job_id, status=FAILED, error=f"error:{e}", finished_at=time.time())
+        else:
+            await self.store.update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+        }
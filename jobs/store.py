@@ -0,0 +1,182 @@
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class MemoryJobStore:
+    """
+    Job records kept in process memory. Beyond max_jobs the oldest
+    finished jobs are dropped.
+    """
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+
+    async def create(self, job_id, payload):
+        job = {
+            "id": job_id,
+            "status": QUEUED,
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            # Process that runs the job
+            "owner": os.getpid(),
+        }
+        self.jobs[job_id] = job
+        self.prune()
+        return dict(job)
+
+    async def update(self, job_id, **fields):
+        if job_id in self.jobs:
+            self.jobs[job_id].update(fields)
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def delete(self, job_id):
+        self.jobs.pop(job_id, None)
+
+    def prune(self):
+        excess = len(self.jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in (SUCCEEDED, FAILED)]
+        for job_id in finished[:excess]:
+            del self.jobs[job_id]
+
+
+class SQLiteJobStore:
+    """
+    Job records kept in a local SQLite database so they survive restarts and
+    can be read by every server worker.
+    Jobs left queued or running by a process that is gone are marked failed.
+    Finished jobs older than ttl seconds are dropped.
+    """
+
+    COLUMNS = ("id", "status", "payload", "result", "error", "created_at", "started_at", "finished_at", "owner")
+    JSON_COLUMNS = ("payload", "result")
+
+    def __init__(self, path="workspace/jobs.sqlite", ttl=7 * 86400):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT, payload TEXT, result TEXT, error TEXT, "
+                "created_at REAL, started_at REAL, finished_at REAL, owner INTEGER)"
+            )
+            columns = [row[1] for row in db.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished_at)")
+            # Other workers may be alive and running their own jobs
+            orphaned = [
+                job_id for job_id, owner in db.execute(
+                    "SELECT id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+                )
+                if not process_alive(owner)
+            ]
+            db.executemany(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                [(FAILED, "Interrupted by server restart", time.time(), job_id) for job_id in orphaned],
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    async def create(self, job_id, payload):
+        job = {
+            "id": job_id,
+            "status": QUEUED,
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            # Process that runs the job
+            "owner": os.getpid(),
+        }
+        await asyncio.to_thread(self._insert, job)
+        return job
+
+    async def update(self, job_id, **fields):
+        await asyncio.to_thread(self._update, job_id, fields)
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self._select, job_id)
+
+    async def delete(self, job_id):
+        await asyncio.to_thread(self._delete, job_id)
+
+    def _insert(self, job):
+        row = [self._encode(column, job[column]) for column in self.COLUMNS]
+        with self._connect() as db:
+            db.execute(f"INSERT INTO jobs VALUES ({', '.join('?' * len(row))})", row)
+            # finished_at is NULL until a job ends, so pending jobs are kept
+            db.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl,))
+
+    def _delete(self, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _update(self, job_id, fields):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        values = [self._encode(column, value) for column, value in fields.items()]
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values, job_id))
+
+    def _select(self, job_id):
+        with self._connect() as db:
+            row = db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {column: self._decode(column, value) for column, value in zip(self.COLUMNS, row)}
+
+    def _encode(self, column, value):
+        if column in self.JSON_COLUMNS and value is not None:
+            return json.dumps(value)
+        return value
+
+    def _decode(self, column, value):
+        if column in self.JSON_COLUMNS and value is not None:
+            return json.loads(value)
+        return value
+
+
+def process_alive(pid) -> bool:
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def create_store(backend="memory", path="workspace/jobs.sqlite", max_jobs=1000, ttl=7 * 86400):
+    if backend == "memory":
+        return MemoryJobStore(max_jobs)
+    if backend == "sqlite":
+        return SQLiteJobStore(path, ttl)
+    raise Exception("Invalid job store backend selected.")
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import json
+import sqlite3
+import time
+
+
+class MemoryCheckpointStore:
+    """
+    Stage outputs kept in process memory, for the most recent max_runs runs.
+    """
+
+    def __init__(self, max_runs=256):
+        self.max_runs = max_runs
+        self.runs = OrderedDict()
+
+    async def get(self, run_id, stage):
+        return self.runs.get(run_id, {}).get(stage)
+
+    async def put(self, run_id, stage, value):
+        self.runs.setdefault(run_id, {})[stage] = value
+        self.runs.move_to_end(run_id)
+        while len(self.runs) > self.max_runs:
+            self.runs.popitem(last=False)
+
+    async def stages(self, run_id) -> list:
+        return sorted(self.runs.get(run_id, {}))
+
+    async def clear(self, run_id):
+        self.runs.pop(run_id, None)
+
+
+class SQLiteCheckpointStore:
+    """
+    Stage outputs kept in a local SQLite database so runs can resume after
+    a restart. Checkpoints older than ttl seconds are dropped on open.
+    """
+
+    def __init__(self, path="workspace/checkpoints.sqlite", ttl=7 * 86400):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "run_id TEXT, stage TEXT, value TEXT, created_at REAL, "
+                "PRIMARY KEY (run_id, stage))"
+            )
+            db.execute("DELETE FROM checkpoints WHERE created_at < ?", (time.time() - ttl,))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    async def get(self, run_id, stage):
+        return await asyncio.to_thread(self._select, run_id, stage)
+
+    async def put(self, run_id, stage, value):
+        await asyncio.to_thread(self._upsert, run_id, stage, value)
+
+    async def stages(self, run_id) -> list:
+        return await asyncio.to_thread(self._stages, run_id)
+
+    async def clear(self, run_id):
+        await asyncio.to_thread(self._delete, run_id)
+
+    def _select(self, run_id, stage):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM checkpoints WHERE run_id = ? AND stage = ?", (run_id, stage)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _upsert(self, run_id, stage, value):
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                (run_id, stage, json.dumps(value), time.time()),
+            )
+
+    def _stages(self, run_id):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT stage FROM checkpoints WHERE run_id = ? ORDER BY stage", (run_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _delete(self, run_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+
+
+def create_checkpoint_store(backend="memory", path="workspace/checkpoints.sqlite"):
+    if backend == "memory":
+        return MemoryCheckpointStore()
+    if backend == "sqlite":
+        return SQLiteCheckpointStore(path)
+    raise Exception("Invalid checkpoint store backend selected.")
@@ -0,0 +1,67 @@
+import asyncio
+
+
+class TaskGraph:
+    """
+    Declarative async stage graph.
+    Each stage starts as soon as all of its dependencies finish and is
+    called with their results as positional arguments, in dependency order.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, func, deps=()):
+        if name in self.stages:
+            raise ValueError(f"Stage already defined: {name}")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    async def run(self) -> dict:
+        """
+        Run every stage and return {stage name: result}.
+        A failing stage cancels only the stages that depend on it; independent
+        stages run to completion before the first failure's exception is raised.
+        """
+        tasks = {}
+        # Stage tasks in the order they finished
+        finished = []
+        try:
+            for name in self.stages:
+                self._schedule(name, tasks, ())
+            for task in tasks.values():
+                task.add_done_callback(finished.append)
+
+            await asyncio.wait(tasks.values())
+            for task in finished:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def _schedule(self, name, tasks, path):
+        if name in tasks:
+            return tasks[name]
+        if name in path:
+            raise ValueError(f"Cycle in task graph: {' -> '.join(path + (name,))}")
+        if name not in self.stages:
+            raise ValueError(f"Unknown stage: {name}")
+
+        func, deps = self.stages[name]
+        dep_tasks = [self._schedule(dep, tasks, path + (name,)) for dep in deps]
+        tasks[name] = asyncio.create_task(self._run_stage(func, dep_tasks), name=name)
+        return tasks[name]
+
+    async def _run_stage(self, func, dep_tasks):
+        results = []
+        for task in dep_tasks:
+            try:
+                results.append(await task)
+            except Exception:
+                # Cancelled rather than failed, so run() raises the original error
+                raise asyncio.CancelledError()
+        return await func(*results)
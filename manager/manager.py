@@ -1,152 +1,440 @@
 import json
-from utils.llm_router import LLM
+from utils.llm_router import create_llm
+from utils.cache import ResponseCache
 from agents.backend import BackendAgent
 from agents.frontend import FrontendAgent
-from agents.reviewer import ReviewerAgent
+from agents.reviewer import ReviewerAgent, REVIEW_CONCURRENCY, REVIEW_BATCH_MAX_FILES
 from agents.frontend_doc import FrontendDocAgent
 from agents.backend_doc import BackendDocAgent
+from manager.graph import TaskGraph
+from utils.tracing import span, current_span
+from utils.shared import shared_state_path
+from utils.prompts import template
+from utils.patch import failing_files
 import asyncio
+import os
+
+# Shared by the per-side and the combined spec prompts
+SPEC_RULES = """GENERAL RULES:
+- This specification must describe a MINIMUM VIABLE PRODUCT (MVP) only.
+- Exclude advanced analytics, charts, dialogs, modals, tabs, or complex UI flows.
+- Prefer the smallest feature set that satisfies core functionality.
+- Assume a single-page implementation unless otherwise required.
+- This document is a technical specification, NOT code.
+- Do NOT include SQL, migrations, database queries, or persistence details.
+- Do NOT include markdown code blocks (no ```).
+- Do NOT include explanations or commentary.
+- Be concise, unambiguous, and implementation-ready.
+- Use markdown headers and bullet points only.
+- Assume the agent has no additional context beyond this spec."""
+
+SPEC_FORMAT = """IMPORTANT: The specification must follow this EXACT format and structure:
+
+## Overview
+[Brief system description]
+
+## Functional Requirements
+- [Bullet point requirement 1]
+- [Bullet point requirement 2]
+
+## Data Models
+- This section defines **in-memory or runtime objects only**, no database or persistence.
+- Use bullets with `field: type`, one field per line.
+- Do NOT use curly braces or JSON syntax.
+- Example:
+    - TrackedItem
+        - id: string
+        - name: string
+        - description: string
+        - currentValue: number
+        - createdAt: datetime
+        - updatedAt: datetime
+    - ValueHistory
+        - id: string
+        - itemId: string
+        - previousValue: number
+        - delta: number
+        - newValue: number
+        - note: string
+        - timestamp: datetime
+
+## API Contracts
+- List endpoints exactly as specified.
+- For each endpoint, use this format:
+    - HTTP_METHOD /api/endpoint
+    - Request:
+        - field_name: type
+        - field_name: type
+    - Response:
+        - field_name: type
+        - field_name: type
+- Do NOT use curly braces, JSON, or code-like syntax.
+- Example:
+    - POST /api/items
+    - Request:
+        - name: string
+        - description: string
+        - currentValue: number
+    - Response:
+        - id: string
+        - name: string
+        - description: string
+        - currentValue: number
+        - createdAt: datetime
+        - updatedAt: datetime
+
+## Error Handling
+- Status code for specific error condition
+- Status code for another error condition
+
+## Output Expectations
+- [Expected implementation detail 1]
+- [Expected implementation detail 2]
+
+REQUIRED FOR BACKEND:
+- Include these exact API endpoints:
+    - POST /api/items
+    - GET /api/items
+    - GET /api/items/{id}
+    - POST /api/items/{id}/change
+    - GET /api/items/{id}/history
+    - DELETE /api/items/{id}
+- Include these exact data models: TrackedItem and ValueHistory
+- TrackedItem must have: id, name, description, currentValue, createdAt, updatedAt
+- ValueHistory must have: id, itemId, previousValue, delta, newValue, note, timestamp
+
+SCOPE LIMITATION:
+- The goal is correctness and integration, NOT completeness.
+- If a feature is not strictly required for core functionality, exclude it."""
+
+# Markers splitting the two cards produced by the combined spec prompt
+SPEC_MARKERS = {
+    "backend": "=== BACKEND SPEC ===",
+    "frontend": "=== FRONTEND SPEC ===",
+}
+
+SPEC_FOCUS = {
+    "backend": "- Focus ONLY on backend concerns (APIs, models, validation, services, error handling).",
+    "frontend": "- Focus ONLY on frontend concerns (UI, state management, API consumption, UX states).",
+}
+
+# One static system prompt per side; the task goes in the user message
+SPEC_PROMPTS = {
+    side: template(f"specs_{side}", "2", f"""
+You are the Manager Agent.
+
+Your responsibility is to generate a **SPECIFICATION CARD** for the {side.upper()} agent.
+This spec will be used by an autonomous agent to generate production code.
+The TASK CONTEXT is given in the user message.
+
+{SPEC_RULES}
+
+AGENT-SPECIFIC RULES:
+{focus}
+- Do NOT reference the other agent's implementation details.
+- Clearly define integration contracts where applicable.
+
+{SPEC_FORMAT}
+
+FINAL RULE:
+This spec must be sufficient for the {side} agent to implement the system without assumptions.
+Output ONLY the specification in the exact format above, nothing else.
+""")
+    for side, focus in SPEC_FOCUS.items()
+}
+
+SHARED_SPEC_PROMPT = template("specs_shared", "2", f"""
+You are the Manager Agent.
+
+Your responsibility is to generate TWO **SPECIFICATION CARDS** in one response:
+one for the BACKEND agent and one for the FRONTEND agent.
+These specs will be used by autonomous agents to generate production code.
+The TASK CONTEXT is given in the user message.
+
+{SPEC_RULES}
+
+AGENT-SPECIFIC RULES:
+- The BACKEND card must focus ONLY on backend concerns (APIs, models, validation, services, error handling).
+- The FRONTEND card must focus ONLY on frontend concerns (UI, state management, API consumption, UX states).
+- Neither card may reference the other agent's implementation details.
+- Both cards must define the SAME integration contracts.
+
+Each card must follow the format below.
+
+{SPEC_FORMAT}
+
+OUTPUT LAYOUT:
+{SPEC_MARKERS["backend"]}
+[backend specification card]
+{SPEC_MARKERS["frontend"]}
+[frontend specification card]
+
+FINAL RULE:
+Each spec must be sufficient for its agent to implement the system without assumptions.
+Output ONLY the two marker lines and specifications in the exact layout above, nothing else.
+""")
+
+SPEC_CACHE_TTL = float(os.getenv("SPEC_CACHE_TTL", "86400"))
+SPEC_CACHE_MAX_ENTRIES = int(os.getenv("SPEC_CACHE_MAX_ENTRIES", "256"))
+# Both spec cards from one LLM call is opt-in: SHARED_SPECS=1
+SHARED_SPECS = os.getenv("SHARED_SPECS", "0") == "1"
+
+# Process-wide spec cache so repeated tasks skip the spec round trip
+spec_cache = ResponseCache(path=shared_state_path("specs"), max_entries=SPEC_CACHE_MAX_ENTRIES, ttl=SPEC_CACHE_TTL)
+
+
+def normalize_task(task: str) -> str:
+    return " ".join(task.split())
+
 
 class ManagerAgent:
-    def __init__(self, task, llm_provider="deepseek", model ="deepseek-chat"):
+    # Part of the spec cache key, so cached specs are invalidated with the prompts
+    SPEC_PROMPT_VERSION = "/".join(prompt.version for prompt in (*SPEC_PROMPTS.values(), SHARED_SPEC_PROMPT))
+
+    def __init__(self, task, llm_provider="deepseek", model ="deepseek-chat", on_event=None, stream_tokens=False, shared_specs=None, overlap_review=True, workspace=None, run_id=None, checkpoints=None):
         self.task = task
+        # Optional ArtifactWorkspace the generated files are written to
+        self.workspace = workspace
+        # With a checkpoint store and run_id every stage output is saved, and
+        # running the same run_id again resumes after the last completed stage
+        self.run_id = run_id
+        self.checkpoints = checkpoints
+        # Review files while the generator is still streaming later ones
+        self.overlap_review = overlap_review
+        # Produce both spec cards with a single LLM call (default: SHARED_SPECS)
+        self.shared_specs = SHARED_SPECS if shared_specs is None else shared_specs
+        # Optional async callback(event, data) notified as each stage completes
+        self.on_event = on_event
+        # Also forward raw LLM token deltas as "token" events
+        self.stream_tokens = stream_tokens
         self.llm_provider = llm_provider
         self.model = model
-        self.llm = LLM(llm_provider, model)
+        self.llm = create_llm("specs", llm_provider, model)
+        # Review verdicts keyed by (path, content hash, prompt version)
+        self.review_cache = {}
     
-    async def call_frontend_agent(self,specs, review = False, review_dict = {},code={}):
-        agent = FrontendAgent(specs=specs)
-        if not review:
-            return await agent.generate_code()
-        return await agent.fix_code(review_report=review_dict,code=code)
+    async def emit(self, event, **data):
+        if self.on_event is not None:
+            await self.on_event(event, data)
+
+    async def restore(self, stage):
+        if self.checkpoints is None or self.run_id is None:
+            return None
+        value = await self.checkpoints.get(self.run_id, stage)
+        current = current_span()
+        if value is not None and current is not None:
+            current.increment("resumed_stages")
+        return value
+
+    async def checkpoint(self, stage, value):
+        if self.checkpoints is not None and self.run_id is not None:
+            await self.checkpoints.put(self.run_id, stage, value)
+
+    async def checkpointed(self, stage, call):
+        """
+        Return the checkpointed output of stage, or await call() and save it.
+        """
+        value = await self.restore(stage)
+        if value is None:
+            value = await call()
+            await self.checkpoint(stage, value)
+        return value
+
+    async def save_revision(self, agent_type, revision, code):
+        # Code first, so the pointer never names a revision that was not saved
+        await self.checkpoint(f"{agent_type}/code/{revision}", code)
+        await self.checkpoint(f"{agent_type}/revision", revision)
+
+    async def latest_revision(self, agent_type):
+        """
+        (revision, code) of the newest checkpointed draft, or None.
+        """
+        revision = await self.restore(f"{agent_type}/revision")
+        if revision is None:
+            return None
+        return revision, await self.restore(f"{agent_type}/code/{revision}")
+
+    async def materialize(self, files):
+        if self.workspace is not None:
+            await self.workspace.materialize(files)
+
+    def token_stream(self, stage, side):
+        """
+        Build an on_token callback forwarding LLM deltas as "token" events.
+        """
+        if self.on_event is None or not self.stream_tokens:
+            return None
+
+        async def on_token(token):
+            await self.emit("token", stage=stage, side=side, token=token)
+
+        return on_token
+
+    def verdict_stream(self, side, revision):
+        if self.on_event is None:
+            return None
+
+        async def on_verdict(verdict):
+            await self.emit("verdict", side=side, revision=revision, verdict=verdict)
+
+        return on_verdict
+
+    async def call_frontend_agent(self,specs, review = False, review_dict = {},code = {}, on_file=None):
+        stage = "fix" if review else "code"
+        agent = FrontendAgent(
+            specs=specs,
+            on_token=self.token_stream(stage, "frontend")
+        )
+        with span(stage, side="frontend") as stage_span:
+            if not review:
+                result = await agent.generate_code(on_file=on_file)
+            else:
+                result = await agent.fix_code(review_report=review_dict,code=code)
+            stage_span.set("files", len(result.get("files", [])))
+            return result
     
-    async def call_backend_agent(self,specs, review = False, review_dict = {},code = {}):
-        agent = BackendAgent(specs=specs)
-        if not review:
-            
-            return await agent.generate_code()
-        return await agent.fix_code(review_report=review_dict,code = code)
+    async def call_backend_agent(self,specs, review = False, review_dict = {},code = {}, on_file=None):
+        stage = "fix" if review else "code"
+        agent = BackendAgent(
+            specs=specs,
+            on_token=self.token_stream(stage, "backend")
+        )
+        with span(stage, side="backend") as stage_span:
+            if not review:
+                result = await agent.generate_code(on_file=on_file)
+            else:
+                result = await agent.fix_code(review_report=review_dict,code=code)
+            stage_span.set("files", len(result.get("files", [])))
+            return result
     
-    async def call_reviewer_agent(self,code):
-        agent = ReviewerAgent(code =code)
-        return await agent.review()
+    async def call_reviewer_agent(self,code, on_verdict=None):
+        agent = ReviewerAgent(code =code, cache=self.review_cache, on_verdict=on_verdict)
+        with span("review", files=len(code["files"])):
+            return await agent.review()
 
-    async def generate_specs(self, agent_type):
-        
-        prompt = f"""
-            You are the Manager Agent.
+    async def generate_and_review(self, specs, agent_type):
+        """
+        Generate code while reviewer workers consume files from a queue as
+        they stream out of the generator. Verdicts land in review_cache, so
+        the first feedback_loop review only calls the LLM for files the
+        workers did not see.
+        """
+        queue = asyncio.Queue()
+        reviewer = ReviewerAgent(
+            cache=self.review_cache,
+            on_verdict=self.verdict_stream(agent_type, 0)
+        )
+
+        async def worker():
+            while True:
+                file = await queue.get()
+                if file is None:
+                    return
+                # Files that queued up meanwhile are reviewed together
+                files = [file]
+                while not queue.empty() and len(files) < REVIEW_BATCH_MAX_FILES:
+                    file = queue.get_nowait()
+                    if file is None:
+                        queue.put_nowait(None)
+                        break
+                    files.append(file)
+                await reviewer.review_files(files)
+
+        async def on_file(file):
+            await queue.put(file)
+
+        call_agent = self.call_backend_agent if agent_type == "backend" else self.call_frontend_agent
+        workers = [asyncio.create_task(worker()) for _ in range(REVIEW_CONCURRENCY)]
+        try:
+            code = await call_agent(specs, on_file=on_file)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+        return code
+
+    def spec_cache_key(self, agent_type):
+        return ResponseCache.make_key(
+            normalize_task(self.task),
+            agent_type,
+            self.SPEC_PROMPT_VERSION,
+            self.llm_provider,
+            self.model
+        )
 
-            Your responsibility is to generate a **SPECIFICATION CARD** for the {agent_type.upper()} agent.
-            This spec will be used by an autonomous agent to generate production code.
+    async def get_specs(self, agent_type):
+        """
+        Return the spec card for one side, from the spec cache when possible.
+        """
+        with span("specs", side=agent_type, shared=self.shared_specs):
+            if self.shared_specs:
+                specs = await spec_cache.get_or_call(
+                    self.spec_cache_key("shared"),
+                    self.generate_shared_specs
+                )
+                return specs[agent_type]
+
+            return await spec_cache.get_or_call(
+                self.spec_cache_key(agent_type),
+                lambda: self.generate_specs(agent_type)
+            )
+
+    async def generate_shared_specs(self):
+        prompt = SHARED_SPEC_PROMPT.render(f"""
+            TASK CONTEXT:
+            {self.task}
+        """)
+
+        result = await self.llm.chat(
+            prompt,
+            type="md",
+            on_token=self.token_stream("specs", "shared")
+        )
+
+        specs = self.split_specs(result)
+        if specs is None:
+            # Fall back to one call per side if the model ignored the layout
+            backend, frontend = await asyncio.gather(
+                self.generate_specs("backend"),
+                self.generate_specs("frontend")
+            )
+            specs = {"backend": backend, "frontend": frontend}
+        return specs
+
+    def split_specs(self, text):
+        backend_at = text.find(SPEC_MARKERS["backend"])
+        frontend_at = text.find(SPEC_MARKERS["frontend"])
+        if backend_at == -1 or frontend_at == -1:
+            return None
+
+        if backend_at < frontend_at:
+            backend = text[backend_at + len(SPEC_MARKERS["backend"]):frontend_at]
+            frontend = text[frontend_at + len(SPEC_MARKERS["frontend"]):]
+        else:
+            frontend = text[frontend_at + len(SPEC_MARKERS["frontend"]):backend_at]
+            backend = text[backend_at + len(SPEC_MARKERS["backend"]):]
+
+        backend, frontend = backend.strip(), frontend.strip()
+        if not backend or not frontend:
+            return None
+        return {"backend": backend, "frontend": frontend}
 
+    async def generate_specs(self, agent_type):
+        prompt = SPEC_PROMPTS[agent_type].render(f"""
             TASK CONTEXT:
             {self.task}
+        """)
 
-            GENERAL RULES:
-            - This specification must describe a MINIMUM VIABLE PRODUCT (MVP) only.
-            - Exclude advanced analytics, charts, dialogs, modals, tabs, or complex UI flows.
-            - Prefer the smallest feature set that satisfies core functionality.
-            - Assume a single-page implementation unless otherwise required.
-            - This document is a technical specification, NOT code.
-            - Do NOT include SQL, migrations, database queries, or persistence details.
-            - Do NOT include markdown code blocks (no ```).
-            - Do NOT include explanations or commentary.
-            - Be concise, unambiguous, and implementation-ready.
-            - Use markdown headers and bullet points only.
-            - Assume the agent has no additional context beyond this spec.
-
-            AGENT-SPECIFIC RULES:
-            {"- Focus ONLY on backend concerns (APIs, models, validation, services, error handling)." if agent_type == "backend" else ""}
-            {"- Focus ONLY on frontend concerns (UI, state management, API consumption, UX states)." if agent_type == "frontend" else ""}
-            - Do NOT reference the other agent's implementation details.
-            - Clearly define integration contracts where applicable.
-
-            IMPORTANT: The specification must follow this EXACT format and structure:
-
-            ## Overview
-            [Brief system description]
-
-            ## Functional Requirements
-            - [Bullet point requirement 1]
-            - [Bullet point requirement 2]
-
-            ## Data Models
-            - This section defines **in-memory or runtime objects only**, no database or persistence.
-            - Use bullets with `field: type`, one field per line.
-            - Do NOT use curly braces or JSON syntax.
-            - Example:
-                - TrackedItem
-                    - id: string
-                    - name: string
-                    - description: string
-                    - currentValue: number
-                    - createdAt: datetime
-                    - updatedAt: datetime
-                - ValueHistory
-                    - id: string
-                    - itemId: string
-                    - previousValue: number
-                    - delta: number
-                    - newValue: number
-                    - note: string
-                    - timestamp: datetime
-
-            ## API Contracts
-            - List endpoints exactly as specified.
-            - For each endpoint, use this format:
-                - HTTP_METHOD /api/endpoint
-                - Request:
-                    - field_name: type
-                    - field_name: type
-                - Response:
-                    - field_name: type
-                    - field_name: type
-            - Do NOT use curly braces, JSON, or code-like syntax.
-            - Example:
-                - POST /api/items
-                - Request:
-                    - name: string
-                    - description: string
-                    - currentValue: number
-                - Response:
-                    - id: string
-                    - name: string
-                    - description: string
-                    - currentValue: number
-                    - createdAt: datetime
-                    - updatedAt: datetime
-
-            ## Error Handling
-            - Status code for specific error condition
-            - Status code for another error condition
-
-            ## Output Expectations
-            - [Expected implementation detail 1]
-            - [Expected implementation detail 2]
-
-            REQUIRED FOR BACKEND:
-            - Include these exact API endpoints:
-                - POST /api/items
-                - GET /api/items
-                - GET /api/items/{id}
-                - POST /api/items/{id}/change
-                - GET /api/items/{id}/history
-                - DELETE /api/items/{id}
-            - Include these exact data models: TrackedItem and ValueHistory
-            - TrackedItem must have: id, name, description, currentValue, createdAt, updatedAt
-            - ValueHistory must have: id, itemId, previousValue, delta, newValue, note, timestamp
-
-            SCOPE LIMITATION:
-            - The goal is correctness and integration, NOT completeness.
-            - If a feature is not strictly required for core functionality, exclude it.
-
-
-            FINAL RULE:
-            This spec must be sufficient for the {agent_type} agent to implement the system without assumptions.
-            Output ONLY the specification in the exact format above, nothing else.
-        """
-
-        result = await self.llm.chat(prompt,type="md")
+        result = await self.llm.chat(
+            prompt,
+            type="md",
+            on_token=self.token_stream("specs", agent_type)
+        )
 
 
         # Ensure string output
@@ -155,6 +443,17 @@ class ManagerAgent:
 
         return result
 
+    def review_errored(self, review):
+        """
+        True if a verdict only failed because the review call itself failed;
+        such reviews are not checkpointed so a resumed run asks again.
+        """
+        return any(
+            issue.get("type") == "error"
+            for verdict in review["files"]
+            for issue in verdict.get("issues", [])
+        )
+
     def approve(self,feedback):
         files = feedback["files"]
 
@@ -164,16 +463,42 @@ class ManagerAgent:
         
         return True
     
-    async def feedback_loop(self,code,agent_type,specs):
+    async def feedback_loop(self,code,agent_type,specs, prereviewed=False, revision=0):
+        """
+        `revision` numbers the draft in `code` (above 0 when resuming);
+        the max_revisions budget counts fixes made by this call only.
+        """
         max_revisions = 3
         revision_count =0
+        # Reviews re-run because review calls failed; these do not use up revisions
+        review_retries = 0
 
         while True:
-            review = await self.call_reviewer_agent(code)
+            review = await self.restore(f"{agent_type}/review/{revision}")
+            if review is None:
+                # Verdicts for prereviewed first drafts were already streamed
+                on_verdict = None if prereviewed and revision_count == 0 else self.verdict_stream(agent_type, revision)
+                review = await self.call_reviewer_agent(code, on_verdict=on_verdict)
+                if not self.review_errored(review):
+                    await self.checkpoint(f"{agent_type}/review/{revision}", review)
             approval = self.approve(review)
+            await self.emit(
+                "review",
+                side=agent_type,
+                revision=revision,
+                approved=approval,
+                review=review
+            )
 
             if approval:
                 return code
+
+            if not failing_files(code, review["files"])[0]["files"]:
+                # Only review calls failed (errors are never cached), so review again
+                if review_retries >= max_revisions:
+                    raise Exception("Review failed repeatedly")
+                review_retries += 1
+                continue
             
             if revision_count >= max_revisions:
                 raise Exception("Max revisions exceeded")
@@ -193,53 +518,117 @@ class ManagerAgent:
                 code=code
             )
             revision_count +=1
+            revision += 1
+            review_retries = 0
+            await self.save_revision(agent_type, revision, code)
+            await self.materialize(code["files"])
+            await self.emit("revision", side=agent_type, revision=revision, code=code)
 
     async def run_backend(self):
-        specs = await self.generate_specs("backend")
-        backend_code = await self.call_backend_agent(specs)
-        result = await self.feedback_loop(backend_code,"backend",specs)
+        with span("side", side="backend"):
+            return await self.build_backend()
+
+    async def build_backend(self):
+        approved = await self.restore("backend/approved")
+        if approved is not None:
+            return approved
+        specs = await self.checkpointed("backend/specs", lambda: self.get_specs("backend"))
+        await self.emit("specs", side="backend", specs=specs)
+        latest = await self.latest_revision("backend")
+        if latest is not None:
+            revision, backend_code = latest
+            prereviewed = False
+        else:
+            if self.overlap_review:
+                backend_code = await self.generate_and_review(specs, "backend")
+            else:
+                backend_code = await self.call_backend_agent(specs)
+            revision = 0
+            prereviewed = self.overlap_review
+            await self.save_revision("backend", revision, backend_code)
+        await self.materialize(backend_code["files"])
+        await self.emit("code", side="backend", code=backend_code)
+        result = await self.feedback_loop(backend_code,"backend",specs, prereviewed=prereviewed, revision=revision)
+        await self.checkpoint("backend/approved", result)
         return result
 
     async def run_frontend(self):
-        specs = await self.generate_specs("frontend")
-        frontend_code = await self.call_frontend_agent(specs)
-        result = await self.feedback_loop(frontend_code,"frontend",specs)
+        with span("side", side="frontend"):
+            return await self.build_frontend()
+
+    async def build_frontend(self):
+        approved = await self.restore("frontend/approved")
+        if approved is not None:
+            return approved
+        specs = await self.checkpointed("frontend/specs", lambda: self.get_specs("frontend"))
+        await self.emit("specs", side="frontend", specs=specs)
+        latest = await self.latest_revision("frontend")
+        if latest is not None:
+            revision, frontend_code = latest
+            prereviewed = False
+        else:
+            if self.overlap_review:
+                frontend_code = await self.generate_and_review(specs, "frontend")
+            else:
+                frontend_code = await self.call_frontend_agent(specs)
+            revision = 0
+            prereviewed = self.overlap_review
+            await self.save_revision("frontend", revision, frontend_code)
+        await self.materialize(frontend_code["files"])
+        await self.emit("code", side="frontend", code=frontend_code)
+        result = await self.feedback_loop(frontend_code,"frontend",specs, prereviewed=prereviewed, revision=revision)
+        await self.checkpoint("frontend/approved", result)
         return result
 
     async def run_frontend_doc(self,frontend_code):
-        agent = FrontendDocAgent(code=frontend_code)
-        frontend_doc = await agent.generate_docs()
+        agent = FrontendDocAgent(
+            code=frontend_code,
+            on_token=self.token_stream("doc", "frontend")
+        )
+        with span("doc", side="frontend"):
+            frontend_doc = await self.checkpointed("frontend/doc", agent.generate_docs)
+        await self.materialize([{"path": "docs/frontend.json", "content": json.dumps(frontend_doc, indent=2)}])
+        await self.emit("doc", side="frontend", doc=frontend_doc)
 
         return frontend_doc
     
     async def run_backend_doc(self,backend_code):
-        agent = BackendDocAgent(code=backend_code)
-        backend_doc = await agent.generate_docs()
+        agent = BackendDocAgent(
+            code=backend_code,
+            on_token=self.token_stream("doc", "backend")
+        )
+        with span("doc", side="backend"):
+            backend_doc = await self.checkpointed("backend/doc", agent.generate_docs)
+        await self.materialize([{"path": "docs/backend.json", "content": json.dumps(backend_doc, indent=2)}])
+        await self.emit("doc", side="backend", doc=backend_doc)
 
         return backend_doc
 
 
-    async def run_manager(self):
-        backend_task = asyncio.create_task(self.run_backend())
-        frontend_task = asyncio.create_task(self.run_frontend())
-
-        backend_code, frontend_code = await asyncio.gather(
-            backend_task,
-            frontend_task
+    def build_graph(self) -> TaskGraph:
+        """
+        Each side's docs start as soon as that side's code is approved.
+        """
+        return (
+            TaskGraph()
+            .add("backendCode", self.run_backend)
+            .add("frontendCode", self.run_frontend)
+            .add("backendDoc", self.run_backend_doc, deps=["backendCode"])
+            .add("frontendDoc", self.run_frontend_doc, deps=["frontendCode"])
         )
-        backend_doc_task = asyncio.create_task(self.run_backend_doc(backend_code))
-        frontend_doc_task = asyncio.create_task(self.run_frontend_doc(frontend_code))
 
-        backend_doc, frontend_doc = await asyncio.gather(
-            backend_doc_task,
-            frontend_doc_task
-        )
+    async def run_manager(self):
+        with span("pipeline", task_chars=len(self.task)):
+            results = await self.build_graph().run()
+        # Finished runs have nothing left to resume
+        if self.checkpoints is not None and self.run_id is not None:
+            await self.checkpoints.clear(self.run_id)
 
         return {
-            "backendCode": backend_code,
-            "frontendCode": frontend_code,
-            "backendDoc": backend_doc,
-            "frontendDoc": frontend_doc,
+            "backendCode": results["backendCode"],
+            "frontendCode": results["frontendCode"],
+            "backendDoc": results["backendDoc"],
+            "frontendDoc": results["frontendDoc"],
         }
 
 if __name__ == "__main__":
@@ -1,57 +1,333 @@
-from fastapi import FastAPI, File, UploadFile, Form,HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, File, UploadFile, Form,HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import docx
-from io import BytesIO
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from typing import Optional
-from manager.manager import ManagerAgent
+from manager.manager import ManagerAgent, normalize_task
+from utils.cache import ResponseCache
+from utils.documents import extract_text_async, shutdown_executor
+from utils import checks
+from utils.artifacts import ArtifactWorkspace, ARCHIVE_FORMATS, valid_run_id
+from utils.llm_router import close_clients, limiter_state, backend_state
+from utils.tracing import tracer
+from jobs.store import create_store, SUCCEEDED, FAILED
+from jobs.scheduler import JobScheduler, QueueFullError
+from manager.checkpoint import create_checkpoint_store
+from utils.shared import SERVER_WORKERS, is_shared, shared_state_path
 import uvicorn
+import asyncio
+import hashlib
+import json
+import os
 
+# With several server workers, job state defaults to SQLite so any worker can answer
+JOB_STORE = os.getenv("JOB_STORE", "sqlite" if is_shared() else "memory")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "workspace/jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Finished jobs kept by the memory store, and their age limit (seconds) in the sqlite store
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "1000"))
+JOB_TTL = int(os.getenv("JOB_TTL", str(7 * 86400)))
+# Stage outputs of unfinished runs, so reruns and job retries resume
+CHECKPOINT_STORE = os.getenv("CHECKPOINT_STORE", "sqlite" if is_shared() else "memory")
+CHECKPOINT_STORE_PATH = os.getenv("CHECKPOINT_STORE_PATH", "workspace/checkpoints.sqlite")
+# Finished /api/generate results reused for identical submissions
+GENERATE_CACHE_TTL = int(os.getenv("GENERATE_CACHE_TTL", "600"))
+GENERATE_CACHE_SIZE = int(os.getenv("GENERATE_CACHE_SIZE", "64"))
+# How long other workers wait on a pipeline claimed by a worker that may have died
+GENERATE_LEASE_TTL = int(os.getenv("GENERATE_LEASE_TTL", "1800"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", "5000000"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Room for the description and multipart framing on top of the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
 
-app = FastAPI(title="Agent Orchestrator Server")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["https://agentic-coder.netlify.app"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+router = APIRouter()
+
+
+async def limit_body_size(request: Request, call_next):
+    """Reject oversized uploads from Content-Length before the body is parsed"""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES:
+        return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
+
+async def run_pipeline(payload, run_id=None):
+    """Run the pipeline, writing its files to the run's artifact workspace and
+    resuming from its checkpoints if an earlier attempt failed"""
+    workspace = ArtifactWorkspace(run_id) if run_id else None
+    # A fresh run (nothing to resume) must not serve files left by an earlier one
+    if workspace is not None and not await checkpoints.stages(run_id):
+        await workspace.reset()
+    manager = ManagerAgent(payload["task"], workspace=workspace, run_id=run_id, checkpoints=checkpoints)
+    return await manager.run_manager()
+
+
+def without_contents(result: dict) -> dict:
+    """Drop file contents from a pipeline result; they can be downloaded as an archive"""
+    slim = dict(result)
+    for key in ("backendCode", "frontendCode"):
+        if isinstance(result.get(key), dict):
+            slim[key] = {"files": [{"path": file["path"]} for file in result[key].get("files", [])]}
+    return slim
+
+
+scheduler = None
+checkpoints = create_checkpoint_store(CHECKPOINT_STORE, CHECKPOINT_STORE_PATH)
+# Shared between workers (including in-flight runs) when state is shared
+generate_cache = ResponseCache(
+    path=shared_state_path("generate"),
+    max_entries=GENERATE_CACHE_SIZE,
+    ttl=GENERATE_CACHE_TTL,
+    lease_ttl=GENERATE_LEASE_TTL,
 )
+# key -> task running (or reading the cache for) that pipeline
+pipelines = {}
 
-def extract_text_from_docx(file_content: bytes) -> str:
-    """Extract text from .docx file"""
-    try:
-        doc = docx.Document(BytesIO(file_content))
-        return "\n".join([paragraph.text for paragraph in doc.paragraphs])
-    except Exception as e:
-        return f"Error reading file: {str(e)}"
 
+def forget_pipeline(key, pipeline):
+    pipelines.pop(key, None)
+    if not pipeline.cancelled():
+        # Mark as retrieved in case every caller disconnected
+        pipeline.exception()
 
-@app.post("/api/generate")
-async def generate_code(file: Optional[UploadFile] = File(None),description: str = Form(...)):
-    task = None
-    if file:
-        content = await file.read()
-        if len(content) > 5000000:
+
+async def coalesced_pipeline(task: str, description: str, upload_digest: Optional[str] = None):
+    """
+    Run the pipeline once per normalized description and uploaded file. The key
+    hashes the raw upload rather than its extracted text, so different files
+    that extract to the same text (e.g. two unreadable documents) never share
+    a run. Identical submissions attach to the in-flight run or reuse a recent
+    result. The run is detached from the request, so one client disconnecting
+    does not cancel it for the others.
+    """
+    key = ResponseCache.make_key("generate", normalize_task(description), upload_digest)
+    # Identical tasks share one artifact workspace too
+    run_id = key[:32]
+    pipeline = pipelines.get(key)
+    if pipeline is None:
+        pipeline = asyncio.create_task(
+            generate_cache.get_or_call(key, lambda: run_pipeline({"task": task}, run_id))
+        )
+        pipelines[key] = pipeline
+        pipeline.add_done_callback(lambda done: forget_pipeline(key, done))
+    return run_id, await asyncio.shield(pipeline)
+
+
+async def startup():
+    global scheduler
+    scheduler = JobScheduler(
+        create_store(JOB_STORE, JOB_STORE_PATH, JOB_MAX_JOBS, JOB_TTL),
+        run_pipeline,
+        workers=JOB_WORKERS,
+        max_queue=JOB_QUEUE_SIZE,
+    )
+    scheduler.start()
+
+
+async def shutdown():
+    await scheduler.stop()
+    await close_clients()
+    shutdown_executor()
+    checks.shutdown_executor()
+    tracer.close()
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Read an upload in chunks, stopping as soon as it exceeds the size limit"""
+    content = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        content += chunk
+        if len(content) > MAX_UPLOAD_BYTES:
             raise HTTPException(status_code=413, detail="File too large")
+    return bytes(content)
 
-        if file.filename.endswith('.docx'):
-            task = extract_text_from_docx(content)
-        else:
-            task = content.decode('utf-8', errors='ignore')
+
+async def read_task(file: Optional[UploadFile], description: str) -> tuple:
+    """Return the task text and a sha256 of the raw upload (None without one)"""
+    if file:
+        content = await read_upload(file)
+        task = await extract_text_async(file.filename, content)
         task += f"\n {description}"
-    else:
-        task = description
-    manager = ManagerAgent(task)
+        return task, hashlib.sha256(content).hexdigest()
+    return description, None
+
+
+@router.post("/api/generate")
+async def generate_code(file: Optional[UploadFile] = File(None),description: str = Form(...),files: bool = Form(True)):
+    """Set files=false to get only file paths and download the code from /api/artifacts/{runId}"""
+    task, upload_digest = await read_task(file, description)
     try:
-        result = await manager.run_manager()
+        run_id, result = await coalesced_pipeline(task, description, upload_digest)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"error:{e}")
     return {
         "status": "success",
-        "result": result
+        "runId": run_id,
+        "result": result if files else without_contents(result)
+    }
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/api/generate/stream")
+async def generate_code_stream(file: Optional[UploadFile] = File(None),description: str = Form(...),tokens: bool = Form(False)):
+    """Stream pipeline progress as Server-Sent Events, ending with a result or error event"""
+    task, _ = await read_task(file, description)
+    events = asyncio.Queue()
+
+    async def on_event(event, data):
+        await events.put((event, data))
+
+    async def run():
+        manager = ManagerAgent(task, on_event=on_event, stream_tokens=tokens)
+        try:
+            result = await manager.run_manager()
+            await events.put(("result", {"status": "success", "result": result}))
+        except Exception as e:
+            await events.put(("error", {"detail": f"error:{e}"}))
+
+    async def stream():
+        pipeline = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await events.get()
+                yield sse_event(event, data)
+                if event in ("result", "error"):
+                    break
+        finally:
+            # Client disconnected or stream finished; stop any remaining work
+            pipeline.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/api/jobs", status_code=202)
+async def submit_job(file: Optional[UploadFile] = File(None),description: str = Form(...)):
+    task, _ = await read_task(file, description)
+    try:
+        job_id = await scheduler.submit({"task": task})
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again later")
+    return {
+        "status": "queued",
+        "jobId": job_id
+    }
+
+
+@router.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await scheduler.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "error": job["error"],
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"],
+    }
+
+
+@router.post("/api/jobs/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str):
+    """Requeue a failed job; completed stages are restored from checkpoints"""
+    job = await scheduler.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != FAILED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    try:
+        await scheduler.retry(job_id, job["payload"])
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again later")
+    return {
+        "status": "queued",
+        "jobId": job_id
+    }
+
+
+@router.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str, files: bool = True):
+    job = await scheduler.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return {
+        "status": "success",
+        "result": job["result"] if files else without_contents(job["result"])
+    }
+
+
+@router.get("/api/artifacts/{run_id}")
+async def download_artifacts(run_id: str, format: str = "zip"):
+    """Stream a run's generated files (job id or runId) as a zip or tar.gz archive"""
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(ARCHIVE_FORMATS)}")
+    if not valid_run_id(run_id):
+        raise HTTPException(status_code=404, detail="Artifacts not found")
+    workspace = ArtifactWorkspace(run_id)
+    if not workspace.exists():
+        raise HTTPException(status_code=404, detail="Artifacts not found")
+    filename = f"{run_id}.zip" if format == "zip" else f"{run_id}.tar.gz"
+    return StreamingResponse(
+        workspace.iter_archive(format),
+        media_type=ARCHIVE_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/api/limits")
+async def limits():
+    """Current rate limiter state per provider and health per backend"""
+    return {
+        "providers": limiter_state(),
+        "backends": backend_state()
     }
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage and per-LLM-call latency histograms in Prometheus text format"""
+    return tracer.render_metrics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+
+def create_app() -> FastAPI:
+    """App factory, e.g. SERVER_WORKERS=4 uvicorn server:create_app --factory --workers 4"""
+    app = FastAPI(title="Agent Orchestrator Server", lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["https://agentic-coder.netlify.app"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(limit_body_size)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=3000)
+    uvicorn.run("server:create_app", factory=True, host="0.0.0.0", port=3000, workers=SERVER_WORKERS)
 
@@ -0,0 +1,76 @@
+import pytest
+
+from utils.checks import check_file
+
+
+def problems(path, content, paths=None):
+    return [issue["message"] for issue in check_file({"path": path, "content": content}, paths)]
+
+
+@pytest.mark.parametrize("path, content", [
+    # Regex literals, including brackets and slashes inside classes
+    ("src/re.ts", "const re = /[(]/g;\nconst trim = s.replace(/\\/+$/, '');\nif (/\\)/.test(s)) { f(); }\n"),
+    # Division is not a regex
+    ("src/math.ts", "const half = (a) / 2;\nconst ratio = items.length / total;\n"),
+    # Template literals with brackets and nested expressions
+    ("src/tpl.ts", "const s = `(${a.map(x => `[${x}]`).join(',')}`;\n"),
+    # Apostrophes and stray parentheses in JSX text
+    ("src/App.tsx", "export default function App() {\n  return <p>Don't panic (really) - it's fine :)</p>;\n}\n"),
+    # Self-closing tags and division inside JSX expressions
+    ("src/Row.jsx", "export const Row = () => <div><br/><Cell value={total / 2} /></div>;\n"),
+    ("src/str.js", "const a = 'a(';\nconst b = \"[\";\nf(a, b);\n"),
+    ("src/comments.ts", "// (\n/* [ */\nconst x = 1;\n"),
+])
+def test_balanced_javascript_passes(path, content):
+    assert problems(path, content) == []
+
+
+@pytest.mark.parametrize("path, content, message", [
+    ("src/a.ts", "function f( {\n  return 1;\n}\n", "Unclosed '('"),
+    ("src/b.ts", "const x = [1, 2);\n", "Unexpected ')'"),
+    ("src/C.tsx", "export const C = () => <div>{value</div>;\n", "Unclosed '{'"),
+])
+def test_unbalanced_javascript_fails(path, content, message):
+    assert problems(path, content) == [message]
+
+
+def test_python_syntax_error():
+    assert problems("app/main.py", "def f(:\n    pass\n")[0].startswith("Syntax error")
+
+
+def test_stdlib_import_shadowed_by_project_package():
+    paths = ["backend/app/email/send.py", "backend/app/main.py"]
+    content = "import email.utils\nfrom email.mime.text import MIMEText\nfrom app.email import send\n"
+    assert problems("backend/app/main.py", content, paths) == []
+
+
+def test_missing_python_module():
+    paths = ["backend/app/main.py", "backend/app/routes/items.py"]
+    content = "from app.routes import items\nfrom app.services.items import create\n"
+    assert problems("backend/app/main.py", content, paths) == ["Import of missing module 'app.services.items'"]
+
+
+def test_relative_python_import():
+    paths = ["app/main.py", "app/models.py"]
+    assert problems("app/main.py", "from .models import Item\n", paths) == []
+    assert problems("app/main.py", "from .schemas import Item\n", paths) == ["Import of missing module 'app.schemas'"]
+
+
+def test_javascript_relative_imports():
+    paths = ["src/App.tsx", "src/api/client.ts", "src/components/index.ts"]
+    content = "import client from './api/client';\nimport { List } from './components';\nimport x from './missing';\n"
+    assert problems("src/App.tsx", content, paths) == ["Import of missing file './missing'"]
+
+
+def test_imports_are_not_checked_without_the_file_set():
+    assert problems("src/App.tsx", "import x from './missing';\n") == []
+
+
+@pytest.mark.parametrize("path, content, ok", [
+    ("package.json", '{"dependencies": {"react": "^18.0.0"}}', True),
+    ("package.json", '{"dependencies": {"react": 18}}', False),
+    ("data.json", '{"a": 1,}', False),
+    ("tsconfig.json", '{"compilerOptions": {}, // comment\n}', True),
+])
+def test_json_files(path, content, ok):
+    assert (problems(path, content) == []) == ok
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from manager.graph import TaskGraph
+
+
+def test_stages_receive_dependency_results():
+    async def value(result):
+        return result
+
+    async def join(*results):
+        return "+".join(results)
+
+    graph = (
+        TaskGraph()
+        .add("a", lambda: value("a"))
+        .add("b", lambda: value("b"))
+        .add("ab", join, deps=["a", "b"])
+    )
+    assert asyncio.run(graph.run()) == {"a": "a", "b": "b", "ab": "a+b"}
+
+
+def test_failure_cancels_only_dependents():
+    started = []
+    finished = []
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        finished.append("independent")
+        return "done"
+
+    async def dependent(*_):
+        started.append("dependent")
+
+    graph = (
+        TaskGraph()
+        .add("failing", fail)
+        .add("child", dependent, deps=["failing"])
+        .add("grandchild", dependent, deps=["child"])
+        .add("independent", slow)
+    )
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(graph.run())
+    assert finished == ["independent"]
+    assert started == []
+
+
+def test_first_failure_is_raised():
+    async def fail(message, delay):
+        await asyncio.sleep(delay)
+        raise RuntimeError(message)
+
+    graph = (
+        TaskGraph()
+        .add("late", lambda: fail("late", 0.05))
+        .add("early", lambda: fail("early", 0))
+    )
+    with pytest.raises(RuntimeError, match="early"):
+        asyncio.run(graph.run())
+
+
+def test_cycle_is_rejected():
+    async def noop(*_):
+        pass
+
+    graph = TaskGraph().add("a", noop, deps=["b"]).add("b", noop, deps=["a"])
+    with pytest.raises(ValueError, match="Cycle"):
+        asyncio.run(graph.run())
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+
+from utils.json_stream import FileEmitter, FileStreamParser, repair_json
+from utils.retry import InvalidJSONError
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Here you go: {"a": 1} Hope this helps!', {"a": 1}),
+    ('{"a": [1, 2,],}', {"a": [1, 2]}),
+    ('{"code": "line1\nline2\tend"}', {"code": "line1\nline2\tend"}),
+    ('{"a": "b", "c": "tru', {"a": "b", "c": "tru"}),
+    ('{"a": {"b": ', {"a": {"b": None}}),
+    ('{"s": "brace } and \\" quote"}', {"s": "brace } and \" quote"}),
+    # A file cut off mid-content is dropped, not kept half written
+    ('{"files": [{"path": "a.py", "content": "x"}, {"path": "b.py", "content": "ha',
+     {"files": [{"path": "a.py", "content": "x"}]}),
+    ('{"files": [{"path": "a.py", "content": "x"}, {"pa', {"files": [{"path": "a.py", "content": "x"}]}),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_without_object():
+    with pytest.raises(InvalidJSONError):
+        repair_json("no json here")
+
+
+RESPONSE = json.dumps({
+    "meta": {"files": [{"path": "ignored", "content": "nested files key"}]},
+    "files": [
+        {"path": "a.py", "content": "def f():\n    return {'x': [1, 2]}\n"},
+        {"path": "b.ts", "content": "const s = \"}]\\\"\";"},
+        {"path": "c.md", "content": "{\"path\": \"not a file\"}"},
+    ],
+})
+EXPECTED = [file["path"] for file in json.loads(RESPONSE)["files"]]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, len(RESPONSE)])
+def test_file_stream_parser_chunking(size):
+    parser = FileStreamParser()
+    files = []
+    for i in range(0, len(RESPONSE), size):
+        files.extend(parser.feed(RESPONSE[i:i + size]))
+    assert [file["path"] for file in files] == EXPECTED
+    assert files == json.loads(RESPONSE)["files"]
+
+
+def test_file_stream_parser_waits_for_closing_brace():
+    parser = FileStreamParser()
+    assert parser.feed('{"files": [{"path": "a.py", "content": "x"') == []
+    assert parser.feed("}") == [{"path": "a.py", "content": "x"}]
+
+
+def test_file_emitter_dedupes_across_restart():
+    emitted = []
+
+    async def on_file(file):
+        emitted.append(file["path"])
+
+    async def run():
+        emitter = FileEmitter(on_file)
+        # First attempt streams one file, then fails
+        await emitter.token(RESPONSE[:RESPONSE.index('{"path": "b.ts"')])
+        emitter.restart()
+        # The retry streams everything again
+        await emitter.token(RESPONSE)
+        await emitter.finish(RESPONSE)
+
+    asyncio.run(run())
+    assert emitted == EXPECTED
@@ -0,0 +1,72 @@
+import asyncio
+
+from agents.backend import BackendAgent
+from agents.backend_doc import BackendDocAgent
+from agents.frontend import FrontendAgent
+from agents.frontend_doc import FrontendDocAgent
+from agents.reviewer import ReviewerAgent
+from manager.manager import ManagerAgent, SPEC_MARKERS
+from utils.prompts import TEMPLATES
+
+MARKER = "per-request-value-7f3a"
+
+
+class RecordingLLM:
+    """Stands in for the LLM client and keeps every prompt it is given."""
+
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+
+    async def chat(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return self.response
+
+
+def test_every_template_has_a_stable_prefix():
+    assert TEMPLATES
+    for template in TEMPLATES.values():
+        first = template.render("first payload")
+        second = template.render(f"second payload {MARKER}")
+        digest = template.digest
+
+        assert first.messages()[0] == second.messages()[0]
+        assert first.messages()[0]["content"].encode() == template.system.encode()
+        assert first.messages()[1] != second.messages()[1]
+        assert template.digest == digest
+
+
+def agent_prompts():
+    code = {"files": [{"path": f"backend/{MARKER}.py", "content": f"x = '{MARKER}'"}]}
+    reviewer = ReviewerAgent(code=code)
+    prompts = [
+        BackendAgent(specs=MARKER).prompt(),
+        FrontendAgent(specs=MARKER).prompt(),
+        BackendDocAgent(code=code).prompt(),
+        FrontendDocAgent(code=code).prompt(),
+        reviewer.prompt(code["files"][0]["content"], code["files"][0]["path"]),
+        reviewer.batch_prompt(code["files"] * 2),
+    ]
+
+    spec_text = f"{SPEC_MARKERS['backend']}\nbackend\n{SPEC_MARKERS['frontend']}\nfrontend"
+    for shared in (False, True):
+        manager = ManagerAgent(f"Build {MARKER}", shared_specs=shared)
+        manager.llm = RecordingLLM(spec_text)
+        if shared:
+            asyncio.run(manager.generate_shared_specs())
+        else:
+            asyncio.run(manager.generate_specs("backend"))
+            asyncio.run(manager.generate_specs("frontend"))
+        prompts.extend(manager.llm.prompts)
+    return prompts
+
+
+def test_system_text_holds_no_per_request_values():
+    prompts = agent_prompts()
+    used = {prompt.template.name for prompt in prompts}
+    assert used == set(TEMPLATES)
+
+    for prompt in prompts:
+        assert MARKER in prompt.user
+        assert MARKER not in prompt.template.system
+        assert "{self" not in prompt.template.system
@@ -0,0 +1,26 @@
+import json
+
+from utils.tracing import JsonLinesExporter
+
+
+def test_jsonl_exporter_writes_queued_spans_on_close(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = JsonLinesExporter(path)
+    for i in range(100):
+        exporter.export({"name": "span", "i": i})
+    exporter.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["i"] for line in lines] == list(range(100))
+
+
+def test_jsonl_exporter_restarts_after_close(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = JsonLinesExporter(path)
+    exporter.export({"name": "first"})
+    exporter.close()
+    exporter.export({"name": "second"})
+    exporter.close()
+
+    names = [json.loads(line)["name"] for line in path.read_text(encoding="utf-8").splitlines()]
+    assert names == ["first", "second"]
@@ -0,0 +1,155 @@
+from pathlib import Path
+from utils.fs import atomic_write, ensure_dir, log, read_json, write_json
+import asyncio
+import hashlib
+import io
+import os
+import re
+import shutil
+import tarfile
+import zipfile
+
+ARTIFACTS_DIR = Path(os.getenv("ARTIFACTS_DIR", "workspace/runs"))
+ARCHIVE_FORMATS = {
+    "zip": "application/zip",
+    "tar": "application/gzip",
+}
+MANIFEST = "manifest.json"
+
+
+def valid_run_id(run_id: str) -> bool:
+    return re.fullmatch(r"[A-Za-z0-9_-]{1,128}", run_id) is not None
+
+
+class ArtifactWorkspace:
+    """
+    Per-run directory holding the generated files.
+    - materialize() writes a batch of files in one worker thread
+    - files are replaced atomically (temp file + rename)
+    - files whose content did not change since the last write are skipped
+    - manifest.json maps each path to its sha256
+    """
+
+    def __init__(self, run_id: str, root: Path = ARTIFACTS_DIR):
+        if not valid_run_id(run_id):
+            raise ValueError(f"Invalid run id: {run_id}")
+        self.run_id = run_id
+        self.path = Path(root) / run_id
+        self.digests = {}
+        manifest = self.path / MANIFEST
+        if manifest.exists():
+            self.digests = read_json(manifest)["files"]
+        self.lock = asyncio.Lock()
+        self.counters = {"written": 0, "unchanged": 0, "rejected": 0}
+
+    def resolve(self, relative: str):
+        """
+        Absolute path for a generated file, or None if it would escape the workspace.
+        """
+        root = self.path.resolve()
+        target = (root / relative).resolve()
+        if relative in ("", MANIFEST) or root not in target.parents:
+            return None
+        return target
+
+    async def materialize(self, files: list) -> int:
+        """
+        Write changed {"path", "content"} files; returns how many were written.
+        """
+        async with self.lock:
+            batch = []
+            digests = dict(self.digests)
+            for file in files:
+                target = self.resolve(file["path"])
+                if target is None:
+                    self.counters["rejected"] += 1
+                    log().warning(f"Rejected artifact path: {file['path']}")
+                    continue
+                digest = hashlib.sha256(file["content"].encode("utf-8")).hexdigest()
+                if digests.get(file["path"]) == digest:
+                    self.counters["unchanged"] += 1
+                    continue
+                batch.append((target, file["content"]))
+                digests[file["path"]] = digest
+
+            if batch:
+                await asyncio.to_thread(self.write_batch, batch, digests)
+                # Only once written, so a failed batch is retried next time
+                self.digests = digests
+                self.counters["written"] += len(batch)
+            return len(batch)
+
+    async def reset(self):
+        """
+        Remove every file of an earlier run, so a fresh run does not serve them.
+        """
+        async with self.lock:
+            await asyncio.to_thread(shutil.rmtree, self.path, True)
+            self.digests = {}
+
+    def write_batch(self, batch, digests):
+        ensure_dir(self.path)
+        for target, content in batch:
+            atomic_write(target, content)
+        write_json(self.path / MANIFEST, {"runId": self.run_id, "files": digests})
+        log().info(f"Materialized {len(batch)} files in {self.path}")
+
+    def exists(self) -> bool:
+        return (self.path / MANIFEST).exists()
+
+    def iter_archive(self, format="zip", chunk_size=64 * 1024):
+        """
+        Yield the workspace as a zip or tar.gz archive, one chunk at a time,
+        without building the whole archive in memory.
+        """
+        buffer = ArchiveBuffer()
+        if format == "zip":
+            archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+            add = lambda path, name: archive.write(path, name)
+        elif format == "tar":
+            archive = tarfile.open(fileobj=buffer, mode="w|gz")
+            add = lambda path, name: archive.add(path, name, recursive=False)
+        else:
+            raise ValueError(f"Unknown archive format: {format}")
+
+        with archive:
+            for path in sorted(self.path.rglob("*")):
+                if not path.is_file() or path.name.endswith(".tmp") or path == self.path / MANIFEST:
+                    continue
+                add(path, f"{self.run_id}/{path.relative_to(self.path)}")
+                if buffer.size() >= chunk_size:
+                    yield buffer.drain()
+        yield buffer.drain()
+
+    def stats(self) -> dict:
+        return {"files": len(self.digests), **self.counters}
+
+
+class ArchiveBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink that hands out what was written so far.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        # zipfile records member offsets while streaming
+        return self.offset
+
+    def size(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses.
+    - In-memory LRU tier bounded by max_entries
+    - Optional on-disk SQLite tier bounded by max_disk_entries
+    - Entries expire after ttl seconds
+    - Concurrent callers asking for the same key share a single call; with
+      the SQLite tier this holds across processes sharing the file, through
+      a lease the computing process holds for up to lease_ttl seconds
+    Values must be JSON serializable when the SQLite tier is used.
+    """
+
+    def __init__(self, path=None, max_entries=1024, max_disk_entries=10000, ttl=86400, lease_ttl=600, poll_interval=0.25):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}"
+        self.memory = OrderedDict()
+        self.inflight = {}
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "shared": 0,
+            "shared_remote": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+        }
+
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                # Values are stored as JSON
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed_at)")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS leases ("
+                    "key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)"
+                )
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    async def get_or_call(self, key, call):
+        """
+        Return the cached value for key, or await call() and cache its result.
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["hits"] += 1
+            return value
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.counters["shared"] += 1
+        else:
+            # The call runs in a task owned by the cache, so cancelling one
+            # caller never cancels the others waiting on the same key
+            task = asyncio.ensure_future(self._fill(key, call))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, call):
+        value = None
+        if self.path:
+            value = await self._disk_get_or_lease(key)
+        if value is None:
+            self.counters["misses"] += 1
+            try:
+                value = await call()
+                if self.path:
+                    await asyncio.to_thread(self._disk_set, key, value)
+            finally:
+                if self.path:
+                    await asyncio.to_thread(self._release, key)
+        else:
+            self.counters["disk_hits"] += 1
+        self._memory_set(key, value)
+        return value
+
+    def _finish(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _disk_get_or_lease(self, key):
+        """
+        Return the stored value, or None once this process holds the lease
+        to compute it. While another process holds the lease, wait for its
+        value to appear (or for the lease to be released or expire).
+        """
+        waited = False
+        while True:
+            value = await asyncio.to_thread(self._disk_get, key)
+            if value is not None:
+                if waited:
+                    self.counters["shared_remote"] += 1
+                return value
+            if await asyncio.to_thread(self._claim, key):
+                return None
+            waited = True
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        stats["memory_entries"] = len(self.memory)
+        stats["inflight"] = len(self.inflight)
+        if self.path:
+            with self._connect() as db:
+                stats["disk_entries"] = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        if self.path:
+            with self._connect() as db:
+                db.execute("DELETE FROM entries")
+
+    def _memory_get(self, key):
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self.memory[key]
+            self.counters["expired"] += 1
+            return None
+        self.memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key, value):
+        self.memory[key] = (time.time() + self.ttl, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _connect(self, isolation_level=""):
+        # One short-lived connection per operation keeps this safe across threads
+        return sqlite3.connect(self.path, timeout=30, isolation_level=isolation_level)
+
+    def _claim(self, key) -> bool:
+        now = time.time()
+        db = self._connect(isolation_level=None)
+        try:
+            # IMMEDIATE takes the write lock up front so two processes cannot both claim
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                db.execute("ROLLBACK")
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self.owner, now + self.lease_ttl),
+            )
+            db.execute("COMMIT")
+            return True
+        finally:
+            db.close()
+
+    def _release(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def _disk_get(self, key):
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.counters["expired"] += 1
+                return None
+            db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def _disk_set(self, key, value):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            db.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+            count = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            overflow = count - self.max_disk_entries
+            if overflow > 0:
+                db.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self.counters["disk_evictions"] += overflow
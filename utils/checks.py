@@ -0,0 +1,350 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+import ast
+import asyncio
+import json
+import os
+import re
+import sys
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# Off switch for the local gate in front of the LLM reviewer
+LOCAL_CHECKS = os.getenv("LOCAL_CHECKS", "on") == "on"
+CHECK_WORKERS = int(os.getenv("CHECK_WORKERS", "2"))
+# Smaller batches are checked in a thread; the process pool round trip costs more
+CHECK_PROCESS_MIN_CHARS = int(os.getenv("CHECK_PROCESS_MIN_CHARS", "200000"))
+
+# (suffixes, func(path, content, paths) -> [issue]); paths is None when
+# the full file set is not known yet
+CHECKS = []
+
+JS_SUFFIXES = (".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs")
+JS_RESOLVE = ("", ".ts", ".tsx", ".js", ".jsx", ".json", "/index.ts", "/index.tsx", "/index.js", "/index.jsx")
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+# A quote after one of these (or a keyword) starts a string literal;
+# after anything else it is JSX text such as "Don't"
+STRING_PREFIX = set("=(,:[{?!&|+-*%;")
+STRING_KEYWORDS = {"return", "case", "from", "import", "typeof", "in", "of", "default", "throw", "yield", "await"}
+# Generated modules that shadow these (e.g. app/email/) do not make "import email" local
+STDLIB_MODULES = frozenset(getattr(sys, "stdlib_module_names", ()))
+
+_executor = None
+
+
+def check(*suffixes):
+    """
+    Register a local check for files ending with any of the suffixes.
+    """
+    def register(func):
+        CHECKS.append((suffixes, func))
+        return func
+    return register
+
+
+def issue(message, line=None) -> dict:
+    return {"type": "static", "message": message, "line": line, "severity": "critical"}
+
+
+@check(".py")
+def python_syntax(path, content, paths):
+    try:
+        ast.parse(content, filename=path)
+    except SyntaxError as e:
+        return [issue(f"Syntax error: {e.msg}", e.lineno)]
+    return []
+
+
+@check(".json")
+def json_syntax(path, content, paths):
+    name = PurePosixPath(path).name
+    # tsconfig/jsconfig allow comments and trailing commas
+    if name.startswith(("tsconfig", "jsconfig")):
+        return []
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        return [issue(f"Invalid JSON: {e.msg}", e.lineno)]
+    if name == "package.json":
+        return package_manifest(data)
+    return []
+
+
+def package_manifest(data):
+    if not isinstance(data, dict):
+        return [issue("package.json must be a JSON object")]
+    issues = []
+    for field in ("dependencies", "devDependencies", "scripts"):
+        value = data.get(field, {})
+        if not isinstance(value, dict) or not all(isinstance(v, str) for v in value.values()):
+            issues.append(issue(f'package.json "{field}" must map names to strings'))
+    return issues
+
+
+@check("pyproject.toml")
+def toml_syntax(path, content, paths):
+    if tomllib is None:
+        return []
+    try:
+        tomllib.loads(content)
+    except tomllib.TOMLDecodeError as e:
+        return [issue(f"Invalid TOML: {e}")]
+    return []
+
+
+@check(*JS_SUFFIXES)
+def bracket_balance(path, content, paths):
+    """
+    Flag obviously unbalanced (), [] and {} outside strings and comments.
+    In JSX files only {} is counted: text between tags may hold stray
+    parentheses, but never a raw brace.
+    Quoted strings end at a newline, and quotes that cannot start a
+    string (see starts_string) are ignored, so JSX text does not throw
+    the count off. Regex literals and escaped characters are skipped too.
+    """
+    brackets = {"{": "}"} if path.endswith((".tsx", ".jsx")) else BRACKETS
+    stack = []
+    line = 1
+    i = 0
+    while i < len(content):
+        char = content[i]
+        if char == "\n":
+            line += 1
+        elif content.startswith("//", i):
+            end = content.find("\n", i)
+            i = len(content) if end == -1 else end
+            continue
+        elif content.startswith("/*", i):
+            end = content.find("*/", i + 2)
+            end = len(content) if end == -1 else end + 2
+            line += content.count("\n", i, end)
+            i = end
+            continue
+        elif char == "`" or (char in "'\"" and starts_string(content, i)):
+            end = skip_string(content, i)
+            line += content.count("\n", i, end)
+            i = end
+            continue
+        elif char == "/" and starts_string(content, i):
+            # A slash where an operand is expected starts a regex literal
+            i = skip_regex(content, i)
+            continue
+        elif char == "\\":
+            i += 2
+            continue
+        elif char in brackets:
+            stack.append((char, line))
+        elif char in brackets.values():
+            if not stack or brackets[stack[-1][0]] != char:
+                return [issue(f"Unexpected '{char}'", line)]
+            stack.pop()
+        i += 1
+    if stack:
+        opener, opened_at = stack[-1]
+        return [issue(f"Unclosed '{opener}'", opened_at)]
+    return []
+
+
+def starts_string(content, i) -> bool:
+    j = i - 1
+    while j >= 0 and content[j].isspace():
+        j -= 1
+    if j < 0 or content[j] in STRING_PREFIX:
+        return True
+    if content[j] == ">":
+        # Arrow function body, not the end of a JSX tag
+        return content[j - 1:j + 1] == "=>"
+    word = re.search(r"[A-Za-z_$]+$", content[:j + 1])
+    return word is not None and word.group() in STRING_KEYWORDS
+
+
+def skip_string(content, start):
+    """
+    Index just past the string literal starting at start.
+    """
+    quote = content[start]
+    i = start + 1
+    while i < len(content):
+        char = content[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == quote:
+            return i + 1
+        if char == "\n" and quote != "`":
+            return i
+        i += 1
+    return i
+
+
+def skip_regex(content, start):
+    """
+    Index just past the regex literal starting at start; a "/" inside
+    a character class does not end it.
+    """
+    in_class = False
+    i = start + 1
+    while i < len(content):
+        char = content[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "\n":
+            return i
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            return i + 1
+        i += 1
+    return i
+
+
+@check(*JS_SUFFIXES)
+def js_relative_imports(path, content, paths):
+    if paths is None:
+        return []
+    issues = []
+    base = PurePosixPath(path).parent
+    pattern = r"""(?:\bfrom\s+|\bimport\s+|\brequire\(\s*)['"](\.{1,2}/[^'"]+)['"]"""
+    for match in re.finditer(pattern, content):
+        target = normalize(base / match.group(1))
+        if not any(target + suffix in paths for suffix in JS_RESOLVE):
+            line = content.count("\n", 0, match.start()) + 1
+            issues.append(issue(f"Import of missing file '{match.group(1)}'", line))
+    return issues
+
+
+@check(".py")
+def python_imports(path, content, paths):
+    if paths is None:
+        return []
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        # Reported by python_syntax
+        return []
+
+    modules = python_modules(paths)
+    packages = {module.split(".")[0] for module in modules if "." in module} - STDLIB_MODULES
+    issues = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom):
+            if node.level:
+                name = relative_module(path, node.level, node.module)
+                # "from . import x" may name a submodule or an attribute
+                if name is None or node.module is None:
+                    continue
+            else:
+                name = node.module
+            names = [name]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            # Only modules of a package that the generated project defines
+            if name.split(".")[0] in packages and name not in modules:
+                issues.append(issue(f"Import of missing module '{name}'", node.lineno))
+    return issues
+
+
+def python_modules(paths) -> set:
+    """
+    Every dotted module name a generated .py file could be imported as,
+    whatever directory the project is run from.
+    """
+    modules = set()
+    for path in paths:
+        if not path.endswith(".py"):
+            continue
+        parts = list(PurePosixPath(path).with_suffix("").parts)
+        if parts[-1] == "__init__":
+            parts.pop()
+        for start in range(len(parts)):
+            modules.add(".".join(parts[start:]))
+            # Intermediate directories count as (namespace) packages
+            for end in range(start + 1, len(parts)):
+                modules.add(".".join(parts[start:end]))
+    modules.discard("")
+    return modules
+
+
+def relative_module(path, level, module):
+    parts = list(PurePosixPath(path).parent.parts)
+    if level - 1 > len(parts):
+        return None
+    parts = parts[:len(parts) - (level - 1)]
+    if module:
+        parts += module.split(".")
+    return ".".join(parts)
+
+
+def normalize(path: PurePosixPath) -> str:
+    parts = []
+    for part in path.parts:
+        if part == "..":
+            if parts:
+                parts.pop()
+        elif part != ".":
+            parts.append(part)
+    return "/".join(parts)
+
+
+def check_file(file, paths=None) -> list:
+    """
+    Run every matching check on one {"path", "content"} file.
+    """
+    issues = []
+    for suffixes, func in CHECKS:
+        if file["path"].endswith(suffixes):
+            issues.extend(func(file["path"], file["content"], paths))
+    return issues
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CHECK_WORKERS)
+    return _executor
+
+
+def check_files(files, paths=None) -> list:
+    return [check_file(file, paths) for file in files]
+
+
+async def run_checks(files, paths=None) -> dict:
+    """
+    Check files off the event loop; returns {path: fail verdict} for the
+    files with problems. Pass paths (the full file set) to also verify
+    that imported local files exist.
+    """
+    if not LOCAL_CHECKS or not files:
+        return {}
+    paths = frozenset(paths) if paths is not None else None
+    if sum(len(file["content"]) for file in files) < CHECK_PROCESS_MIN_CHARS:
+        results = await asyncio.to_thread(check_files, files, paths)
+    else:
+        loop = asyncio.get_running_loop()
+        size = -(-len(files) // CHECK_WORKERS)
+        chunks = [files[i:i + size] for i in range(0, len(files), size)]
+        chunk_results = await asyncio.gather(*(
+            loop.run_in_executor(get_executor(), check_files, chunk, paths) for chunk in chunks
+        ))
+        results = [issues for chunk in chunk_results for issues in chunk]
+    return {
+        file["path"]: {"path": file["path"], "status": "fail", "issues": issues}
+        for file, issues in zip(files, results)
+        if issues
+    }
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from utils.cache import ResponseCache
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+
+# "thread" or "process"; parsing large .docx/.pdf files is CPU bound
+EXTRACT_POOL = os.getenv("EXTRACT_POOL", "thread")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_CACHE_SIZE = int(os.getenv("EXTRACT_CACHE_SIZE", "256"))
+EXTRACT_CACHE_TTL = int(os.getenv("EXTRACT_CACHE_TTL", "3600"))
+
+# file suffix -> function(bytes) -> str
+EXTRACTORS = {}
+
+_executor = None
+_text_cache = ResponseCache(max_entries=EXTRACT_CACHE_SIZE, ttl=EXTRACT_CACHE_TTL)
+
+
+def extractor(*suffixes):
+    """
+    Register a text extractor for the given file suffixes.
+    """
+    def register(func):
+        for suffix in suffixes:
+            EXTRACTORS[suffix] = func
+        return func
+    return register
+
+
+@extractor(".txt", ".md")
+def plain_text(content: bytes) -> str:
+    return content.decode("utf-8", errors="ignore")
+
+
+@extractor(".docx")
+def docx_text(content: bytes) -> str:
+    """Extract text from .docx file"""
+    import docx
+    try:
+        doc = docx.Document(BytesIO(content))
+        return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+
+def pdf_text(content: bytes) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        result = subprocess.run(
+            ["pdftotext", "-q", "-", "-"], input=content, capture_output=True, timeout=60
+        )
+        if result.returncode != 0:
+            return f"Error reading file: pdftotext exited with {result.returncode}"
+        return result.stdout.decode("utf-8", errors="ignore")
+    try:
+        reader = PdfReader(BytesIO(content))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+
+def pdf_available() -> bool:
+    try:
+        import pypdf
+        return True
+    except ImportError:
+        return shutil.which("pdftotext") is not None
+
+
+if pdf_available():
+    extractor(".pdf")(pdf_text)
+
+
+def extract_text(filename: str, content: bytes) -> str:
+    """
+    Text of an uploaded file; unknown types are decoded as UTF-8.
+    """
+    func = EXTRACTORS.get(Path(filename or "").suffix.lower(), plain_text)
+    return func(content)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if EXTRACT_POOL == "process":
+            _executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+    return _executor
+
+
+async def extract_text_async(filename: str, content: bytes) -> str:
+    """
+    Extract off the event loop, reusing the result for identical uploads.
+    """
+    suffix = Path(filename or "").suffix.lower()
+    key = ResponseCache.make_key("extract", suffix, hashlib.sha256(content).hexdigest())
+    loop = asyncio.get_running_loop()
+    return await _text_cache.get_or_call(
+        key, lambda: loop.run_in_executor(get_executor(), extract_text, filename, content)
+    )
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
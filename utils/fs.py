@@ -1,14 +1,29 @@
 from pathlib import Path
 import json
+import os
 import shutil
 import logging
+import tempfile
+import threading
 
-# Basic logger (used by all agents)
-logging.basicConfig(
-    filename="workspace/logs/fs.log",
-    level=logging.INFO,
-    format="%(asctime)s [FS] %(message)s"
-)
+LOG_PATH = Path(os.getenv("FS_LOG_PATH", "workspace/logs/fs.log"))
+
+logger = logging.getLogger("fs")
+_log_lock = threading.Lock()
+
+
+def log() -> logging.Logger:
+    """
+    Logger for file operations; the log file is only opened on first use.
+    """
+    with _log_lock:
+        if not logger.handlers:
+            LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.FileHandler(LOG_PATH, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s [FS] %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+    return logger
 
 
 def ensure_dir(path: Path):
@@ -22,14 +37,28 @@ def safe_write_file(path: Path, content: str):
     """
     Safely write content to a file.
     - Creates parent directories automatically
-    - Overwrites existing file
+    - Overwrites existing file atomically (temp file + rename)
     - Uses UTF-8 encoding
     """
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    atomic_write(path, content)
 
-    logging.info(f"Wrote file: {path}")
+    log().info(f"Wrote file: {path}")
+
+
+def atomic_write(path: Path, content: str):
+    """
+    Write to a temp file next to path and rename it into place, so readers
+    never see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
 def safe_read_file(path: Path) -> str:
@@ -45,11 +74,9 @@ def write_json(path: Path, data: dict):
     """
     Write JSON data safely.
     """
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    atomic_write(path, json.dumps(data, indent=2))
 
-    logging.info(f"Wrote JSON: {path}")
+    log().info(f"Wrote JSON: {path}")
 
 
 def read_json(path: Path) -> dict:
@@ -69,4 +96,4 @@ def copy_tree(src: Path, dst: Path):
         shutil.rmtree(dst)
     shutil.copytree(src, dst)
 
-    logging.info(f"Copied {src} -> {dst}")
+    log().info(f"Copied {src} -> {dst}")
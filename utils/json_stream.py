@@ -0,0 +1,209 @@
+import json
+import re
+
+from utils.retry import InvalidJSONError
+
+# Raw control characters LLMs tend to leave unescaped inside strings
+STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_fences(text: str) -> str:
+    text = text.strip()
+    # Remove ```json or ``` at the start
+    text = re.sub(r"^```[a-zA-Z]*\n?", "", text)
+    # Remove ``` at the end
+    return re.sub(r"\n?```$", "", text)
+
+
+def repair_json(text: str) -> str:
+    """
+    Extract the first JSON object from an LLM response and fix common faults:
+    - code fences and text around the object
+    - raw newlines/tabs inside strings
+    - trailing commas
+    - output truncated mid-string or mid-object; an unfinished object
+      inside an array (e.g. the last of "files") is dropped rather than
+      kept with half its content
+    Raises InvalidJSONError if no object is present.
+    """
+    text = strip_fences(text)
+    start = text.find("{")
+    if start == -1:
+        raise InvalidJSONError("No JSON object found in LLM response")
+
+    out = []
+    stack = []
+    # Index in out where each open container starts
+    starts = []
+    in_string = False
+    escape = False
+    for char in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == '"':
+                in_string = False
+                out.append(char)
+            else:
+                out.append(STRING_ESCAPES.get(char, char))
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in CLOSERS:
+            stack.append(char)
+            starts.append(len(out))
+            out.append(char)
+        elif char in "}]":
+            drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+                starts.pop()
+            out.append(char)
+            if not stack:
+                break
+        else:
+            out.append(char)
+
+    # Truncated output: drop an unfinished array element object
+    if len(stack) >= 2 and stack[-1] == "{" and stack[-2] == "[":
+        del out[starts[-1]:]
+        stack.pop()
+        starts.pop()
+        in_string = False
+        drop_trailing_comma(out)
+    # Close whatever is still open
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    if stack:
+        drop_trailing_comma(out)
+        if "".join(out).rstrip().endswith(":"):
+            out.append("null")
+        for opener in reversed(stack):
+            out.append(CLOSERS[opener])
+
+    return "".join(out)
+
+
+def drop_trailing_comma(out: list):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def tolerant_loads(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(text))
+    except json.JSONDecodeError as e:
+        raise InvalidJSONError(f"LLM returned invalid JSON: {e}")
+
+
+class FileStreamParser:
+    """
+    Incrementally scan a streamed {"files": [...]} response and return each
+    {"path", "content"} object as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_key = None
+        # Stack depth of the "files" array once it has been opened
+        self.files_depth = None
+        self.object_start = None
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        completed = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        self.last_key = self.buffer[self.string_start + 1:self.pos]
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif char in CLOSERS:
+                if char == "[" and len(self.stack) == 1 and self.last_key == "files":
+                    self.files_depth = len(self.stack) + 1
+                if char == "{" and self.files_depth is not None and len(self.stack) == self.files_depth:
+                    self.object_start = self.pos
+                self.stack.append(char)
+            elif char in "}]" and self.stack:
+                self.stack.pop()
+                if char == "}" and self.object_start is not None and len(self.stack) == self.files_depth:
+                    file = self.parse_file(self.buffer[self.object_start:self.pos + 1])
+                    if file is not None:
+                        completed.append(file)
+                    self.object_start = None
+                elif char == "]" and self.files_depth is not None and len(self.stack) < self.files_depth:
+                    self.files_depth = None
+            self.pos += 1
+        return completed
+
+    def parse_file(self, text):
+        try:
+            file = tolerant_loads(text)
+        except InvalidJSONError:
+            return None
+        if isinstance(file, dict) and "path" in file and "content" in file:
+            return file
+        return None
+
+
+class FileEmitter:
+    """
+    Forward each streamed file to on_file exactly once (by path).
+    restart() resets the parser for a retried attempt; finish() emits any
+    file the stream did not deliver, e.g. after a cache hit.
+    """
+
+    def __init__(self, on_file, on_token=None):
+        self.on_file = on_file
+        self.on_token = on_token
+        self.parser = FileStreamParser()
+        self.emitted = set()
+
+    def restart(self):
+        self.parser = FileStreamParser()
+
+    async def token(self, delta):
+        if self.on_token is not None:
+            await self.on_token(delta)
+        for file in self.parser.feed(delta):
+            await self.emit(file)
+
+    async def emit(self, file):
+        if file["path"] in self.emitted:
+            return
+        self.emitted.add(file["path"])
+        await self.on_file(file)
+
+    async def finish(self, text):
+        result = tolerant_loads(text)
+        for file in result.get("files", []) if isinstance(result, dict) else []:
+            if isinstance(file, dict) and "path" in file and "content" in file:
+                await self.emit(file)
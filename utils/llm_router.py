@@ -1,82 +1,501 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-import os
-import re
+from collections import deque
+from utils.cache import ResponseCache
+from utils.rate_limit import ProviderLimiter
+from utils.retry import RetryPolicy, Hedger, InvalidJSONError, TruncatedResponseError, current_deadline
+from utils.tracing import span, current_span
+from utils.json_stream import FileEmitter, repair_json
+from utils.tokens import count_tokens, completion_budget
+from utils.shared import SERVER_WORKERS, shared_state_path
+from utils.prompts import Prompt, as_messages
 import asyncio
+import httpx
+import json
+import os
+import time
+import weakref
 
 load_dotenv()
 
+# provider -> (api key env var, base url)
+PROVIDERS = {
+    "deepseek": ("DEEPSEEK_API_KEY", "https://api.deepseek.com"),
+    "groq": ("GROQ_API_KEY", "https://api.groq.com/openai/v1"),
+    "gemini": ("GEMINI_API_KEY", "https://generativelanguage.googleapis.com/v1beta/openai/"),
+}
+
+# Connection pool limits shared by every client in the registry
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "600"))
+
+# Free-tier style defaults; override with LLM_<PROVIDER>_RPM / _TPM (0 = unlimited)
+PROVIDER_LIMITS = {
+    "deepseek": {"rpm": 0, "tpm": 0},
+    "groq": {"rpm": 30, "tpm": 6000},
+    "gemini": {"rpm": 15, "tpm": 250000},
+}
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+
+# Retry budget per call and total deadline (seconds) per pipeline stage
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+STAGE_DEADLINES = {
+    "specs": 180,
+    "code": 420,
+    "review": 120,
+    "doc": 240,
+}
+# Hedged requests are opt-in: LLM_HEDGE=1
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+
+# Per-role backend routes, e.g. LLM_ROUTE_REVIEW="groq:llama-3.1-8b-instant,deepseek:deepseek-chat"
+# and LLM_ROUTE_POLICY_REVIEW="fastest" (default) or "priority" (first healthy backend in order)
+ROUTE_POLICIES = ("fastest", "priority")
+
+# Response cache is opt-in: LLM_CACHE=memory or LLM_CACHE=disk
+LLM_CACHE = os.getenv("LLM_CACHE", "off")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "workspace/cache/llm_responses.sqlite")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "10000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# event loop -> {(provider, base_url, api_key) -> AsyncOpenAI}
+# A client's connection pool cannot outlive the loop that opened it
+_clients = weakref.WeakKeyDictionary()
+# event loop -> {provider -> ProviderLimiter}
+# Limiters hold asyncio locks/conditions, which bind to the loop that first waits on them
+_limiters = weakref.WeakKeyDictionary()
+# (provider, model) -> Hedger
+_hedgers = {}
+# (provider, model) -> BackendHealth
+_health = {}
+_response_cache = None
+
+
+def get_client(provider, base_url, api_key):
+    """
+    Return the shared AsyncOpenAI client for a provider endpoint on the
+    running event loop. Clients are created once per loop and reuse their
+    keep-alive connection pool.
+    """
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    key = (provider, base_url, api_key)
+    client = clients.get(key)
+    if client is None:
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT),
+        )
+        clients[key] = client
+    return client
+
+
+async def close_clients():
+    """
+    Close every pooled client of the running loop (call on application shutdown).
+    """
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+def get_limiter(provider):
+    """
+    Return the rate limiter shared by every LLM for a provider on the
+    running event loop.
+    """
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    limiter = limiters.get(provider)
+    if limiter is None:
+        defaults = PROVIDER_LIMITS.get(provider, {"rpm": 0, "tpm": 0})
+        prefix = f"LLM_{provider.upper()}"
+        limiter = ProviderLimiter(
+            provider,
+            rpm=int(os.getenv(f"{prefix}_RPM", defaults["rpm"])),
+            tpm=int(os.getenv(f"{prefix}_TPM", defaults["tpm"])),
+            # Each server worker gets its share of the concurrency cap
+            max_concurrency=max(1, LLM_MAX_CONCURRENCY // SERVER_WORKERS),
+            initial_concurrency=max(1, LLM_INITIAL_CONCURRENCY // SERVER_WORKERS),
+            shared_path=shared_state_path("limits"),
+        )
+        limiters[provider] = limiter
+    return limiter
+
+
+def get_hedger(provider, model):
+    key = (provider, model)
+    if key not in _hedgers:
+        _hedgers[key] = Hedger()
+    return _hedgers[key]
+
+
+def retry_policy(stage=None):
+    deadline = None
+    if stage is not None:
+        deadline = float(os.getenv(f"LLM_DEADLINE_{stage.upper()}", STAGE_DEADLINES.get(stage, 0))) or None
+    return RetryPolicy(attempts=LLM_RETRY_ATTEMPTS, deadline=deadline)
+
+
+def limiter_state() -> list:
+    limiters = _limiters.get(asyncio.get_running_loop(), {})
+    return [limiter.state() for limiter in limiters.values()]
+
+
+def estimate_tokens(messages) -> int:
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def cached_tokens(usage):
+    """
+    Prompt tokens served from the provider's prompt cache, when reported.
+    """
+    # DeepSeek
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is None:
+        # OpenAI-style (Groq, Gemini)
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit = getattr(details, "cached_tokens", None) if details is not None else None
+    return hit
+
+
+def get_response_cache():
+    """
+    Return the process-wide response cache, or None when caching is off.
+    """
+    global _response_cache
+    if _response_cache is None and LLM_CACHE in ("memory", "disk"):
+        _response_cache = ResponseCache(
+            path=LLM_CACHE_PATH if LLM_CACHE == "disk" else None,
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            max_disk_entries=LLM_CACHE_MAX_DISK_ENTRIES,
+            ttl=LLM_CACHE_TTL,
+        )
+    return _response_cache
+
+
 class LLM:
-    def __init__(self, provider, model) -> None:
+    def __init__(self, provider, model, cache=None, stage=None, hedge=LLM_HEDGE) -> None:
         self.provider = provider
         self.model = model
+        # Pipeline stage (specs, code, review, doc) selecting the retry deadline
+        self.stage = stage
+        self.retry = retry_policy(stage)
+        self.hedger = get_hedger(provider, model) if hedge else None
+        self.retries = 0
+        self.cache = cache if cache is not None else get_response_cache()
 
-        if provider == "deepseek":
-            self.api_key = os.getenv("DEEPSEEK_API_KEY")
-            self.base_url = "https://api.deepseek.com"
-        elif provider =="groq":
-            self.api_key = os.getenv("GROQ_API_KEY")
-            self.base_url = "https://api.groq.com/openai/v1"
-        elif provider=="gemini":
-            self.api_key = os.getenv("GEMINI_API_KEY")
-            self.base_url = "https://generativelanguage.googleapis.com/v1beta/openai/"
-        else:
+        if provider not in PROVIDERS:
             raise Exception("Invalid provider selected.")
 
-        self.client= OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
+        key_env, base_url = PROVIDERS[provider]
+        self.api_key = os.getenv(key_env)
+        # e.g. DEEPSEEK_BASE_URL points a provider at a proxy or the offline mock server
+        self.base_url = os.getenv(f"{provider.upper()}_BASE_URL", base_url)
 
-    async def chat(self, prompt, type="json"):
-        loop = asyncio.get_running_loop()
+    @property
+    def limiter(self):
+        return get_limiter(self.provider)
 
-        if type =="json":
-            return await loop.run_in_executor(
-                None,
-                self.json_response,
-                prompt
-            )
-        else:
-            return await loop.run_in_executor(
-                None,
-                self.normal_response,
-                prompt
-            )
+    @property
+    def client(self):
+        return get_client(self.provider, self.base_url, self.api_key)
 
-    def json_response(self, prompt):
-        messages = [{"role": "system", "content": prompt}]
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages
-        )
-        return self.extract_json(response.choices[0].message.content)
+    async def chat(self, prompt, type="json", on_token=None, on_file=None):
+        """
+        prompt: a Prompt (static system message + user message) or a plain
+        string sent as a single system message.
+        on_token: optional async callback receiving each streamed text delta.
+        on_file: optional async callback receiving each {"path", "content"}
+        object of a {"files": [...]} response as soon as it is complete.
+        """
+        emitter = FileEmitter(on_file, on_token) if on_file is not None else None
+        if emitter is not None:
+            on_token = emitter.token
 
-    def normal_response(self, prompt):
-        messages = [{"role": "system", "content": prompt}]
-        response = self.client.chat.completions.create(
+        with span(
+            "llm.chat",
+            provider=self.provider,
             model=self.model,
-            messages=messages
+            stage=self.stage,
+            prompt_chars=len(prompt),
+            prompt_template=prompt.template.id if isinstance(prompt, Prompt) else None,
+            # Same digest on every call of a role means the provider can reuse its prefix cache
+            prompt_prefix=prompt.template.digest if isinstance(prompt, Prompt) else None
+        ) as chat_span:
+            async def call():
+                chat_span.set("cache", "miss")
+                return await self.respond(prompt, type, on_token, emitter)
+
+            if self.cache is None:
+                result = await call()
+            else:
+                chat_span.set("cache", "hit")
+                parts = prompt.key_parts() if isinstance(prompt, Prompt) else (prompt,)
+                key = ResponseCache.make_key(self.provider, self.model, *parts, type)
+                result = await self.cache.get_or_call(key, call)
+
+            chat_span.set("response_chars", len(result))
+            if emitter is not None:
+                await emitter.finish(result)
+            return result
+
+    async def respond(self, prompt, type, on_token=None, emitter=None):
+        return await self.retry.run(
+            lambda: self.attempt(prompt, type, on_token, emitter),
+            on_retry=self.count_retry
         )
-        return response.choices[0].message.content
+
+    def count_retry(self, attempt, error):
+        self.retries += 1
+        current = current_span()
+        if current is not None:
+            current.increment("retries")
+
+    async def attempt(self, prompt, type, on_token=None, emitter=None):
+        if emitter is not None:
+            # A retried stream starts a new document
+            emitter.restart()
+        if type == "json":
+            call = lambda: self.json_response(prompt, on_token)
+        else:
+            call = lambda: self.normal_response(prompt, on_token)
+
+        # Duplicated calls would interleave streamed tokens, so only hedge silent calls
+        if self.hedger is None or on_token is not None:
+            return await call()
+        return await self.hedger.run(call)
+
+    async def json_response(self, prompt, on_token=None):
+        messages = as_messages(prompt)
+        # A JSON document cut off at max_tokens would be "repaired" into a partial result
+        content = await self.complete(messages, on_token, complete_only=True)
+        text = self.extract_json(content)
+        try:
+            json.loads(text)
+        except json.JSONDecodeError as e:
+            raise InvalidJSONError(f"LLM returned invalid JSON: {e}")
+        return text
+
+    async def normal_response(self, prompt, on_token=None):
+        messages = as_messages(prompt)
+        return await self.complete(messages, on_token)
+
+    async def complete(self, messages, on_token=None, complete_only=False):
+        """
+        complete_only: raise TruncatedResponseError (retried like invalid
+        JSON) when the model stopped because it hit max_tokens.
+        """
+        prompt_tokens = estimate_tokens(messages)
+        # Raises PromptTooLargeError before anything is sent
+        max_tokens = completion_budget(self.provider, self.stage, prompt_tokens)
+        with span("llm.request", provider=self.provider, model=self.model, streamed=on_token is not None) as request_span:
+            request_span.set("max_tokens", max_tokens)
+            content, finish_reason = await self.request(messages, on_token, prompt_tokens, max_tokens, request_span)
+            request_span.set("finish_reason", finish_reason)
+            if complete_only and finish_reason == "length":
+                raise TruncatedResponseError(f"LLM response was cut off at {max_tokens} tokens")
+            return content
+
+    async def request(self, messages, on_token, estimated, max_tokens, request_span):
+        waiting_since = time.monotonic()
+        # Time queued for rate limits does not count against the stage deadline
+        async with self.limiter.slot(estimated, waiting=current_deadline()) as usage:
+            request_span.set("limiter_wait", round(time.monotonic() - waiting_since, 3))
+            if on_token is None:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens
+                )
+                if response.usage is not None:
+                    usage["tokens"] = response.usage.total_tokens
+                    self.record_usage(response.usage, request_span)
+                choice = response.choices[0]
+                return choice.message.content, choice.finish_reason
+
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True,
+                # Final chunk carries usage, including prompt cache hits
+                stream_options={"include_usage": True}
+            )
+            parts = []
+            reported = None
+            finish_reason = None
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    reported = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    await on_token(delta)
+            content = "".join(parts)
+            if reported is not None:
+                usage["tokens"] = reported.total_tokens
+                self.record_usage(reported, request_span)
+            else:
+                usage["tokens"] = estimated + count_tokens(content)
+                request_span.set("estimated_tokens", usage["tokens"])
+            return content, finish_reason
+
+    def record_usage(self, reported, request_span):
+        request_span.set("prompt_tokens", reported.prompt_tokens)
+        request_span.set("completion_tokens", reported.completion_tokens)
+        hit = cached_tokens(reported)
+        if hit is not None:
+            request_span.set("cached_tokens", hit)
 
     def extract_json(self, text):
-        text = text.strip()
+        return repair_json(text)
+
+
+class BackendHealth:
+    """
+    Rolling latency and error rate for one provider/model backend.
+    After `failure_threshold` consecutive failures the backend is skipped
+    for `cooldown` seconds.
+    """
+
+    def __init__(self, provider, model, window=20, failure_threshold=3, cooldown=30):
+        self.provider = provider
+        self.model = model
+        self.latency = None
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0
+
+    def record_success(self, seconds):
+        # Exponentially weighted moving average
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self) -> float:
+        # Unmeasured backends score 0 so each one gets tried
+        return (self.latency or 0) * (1 + 4 * self.error_rate())
+
+    def state(self) -> dict:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "errorRate": round(self.error_rate(), 3),
+            "available": self.available(),
+        }
+
+
+def get_health(provider, model):
+    key = (provider, model)
+    if key not in _health:
+        _health[key] = BackendHealth(provider, model)
+    return _health[key]
+
+
+def backend_state() -> list:
+    return [health.state() for health in _health.values()]
+
+
+class LLMRouter:
+    """
+    Drop-in replacement for LLM that spreads calls over several backends.
+    - "fastest": healthiest/fastest backend first, others as failover
+    - "priority": backends in configured order, skipping unhealthy ones
+    """
+
+    def __init__(self, backends, stage=None, policy="fastest") -> None:
+        if policy not in ROUTE_POLICIES:
+            raise Exception("Invalid routing policy selected.")
+        self.policy = policy
+        self.stage = stage
+        self.llms = [LLM(provider, model, stage=stage) for provider, model in backends]
+
+    def candidates(self) -> list:
+        available = [llm for llm in self.llms if get_health(llm.provider, llm.model).available()]
+        if not available:
+            # Every backend is cooling down; try them all rather than fail outright
+            available = list(self.llms)
+        if self.policy == "fastest":
+            available.sort(key=lambda llm: get_health(llm.provider, llm.model).score())
+        return available
+
+    async def chat(self, prompt, type="json", on_token=None, on_file=None):
+        if on_file is not None:
+            # Failover re-streams the response; forward each path only once
+            on_file = self.dedupe_files(on_file)
+
+        error = None
+        for llm in self.candidates():
+            health = get_health(llm.provider, llm.model)
+            started_at = time.monotonic()
+            try:
+                result = await llm.chat(prompt, type=type, on_token=on_token, on_file=on_file)
+            except Exception as e:
+                health.record_failure()
+                error = e
+                continue
+            health.record_success(time.monotonic() - started_at)
+            return result
+        raise error
+
+    def dedupe_files(self, on_file):
+        seen = set()
 
-        # Remove ```json or ``` at the start
-        text = re.sub(r"^```[a-zA-Z]*\n?", "", text)
+        async def forward(file):
+            if file["path"] not in seen:
+                seen.add(file["path"])
+                await on_file(file)
 
-        # Remove ``` at the end
-        text = re.sub(r"\n?```$", "", text)
+        return forward
 
-        # Now extract the JSON object itself
-        match = re.search(r"\{[\s\S]*\}", text)
-        if not match:
-            raise ValueError("No JSON object found in LLM response")
 
-        return match.group(0)
-    
+def parse_routes(value):
+    """
+    Parse "provider:model,provider:model" into [(provider, model), ...].
+    """
+    backends = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if entry:
+            provider, model = entry.split(":", 1)
+            backends.append((provider.strip(), model.strip()))
+    return backends
 
-        
 
-        
\ No newline at end of file
+def create_llm(role, provider="deepseek", model="deepseek-chat"):
+    """
+    Build the client for an agent role (specs, code, review, doc).
+    LLM_ROUTE_<ROLE> overrides the agent's default provider/model.
+    """
+    routes = parse_routes(os.getenv(f"LLM_ROUTE_{role.upper()}", "")) or [(provider, model)]
+    policy = os.getenv(f"LLM_ROUTE_POLICY_{role.upper()}", "fastest")
+    return LLMRouter(routes, stage=role, policy=policy)
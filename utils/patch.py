@@ -0,0 +1,33 @@
+def failing_files(code: dict, review_report: list) -> tuple:
+    """
+    Select the files that failed review.
+    Returns ({"files": [...]} with only failing files, [{"path", "issues"}])
+    where issues are limited to critical ones. Files whose only problem is
+    a failed review call ("error" issues) are not selected; there is
+    nothing in them to fix.
+    """
+    failed = {}
+    for verdict in review_report:
+        if verdict.get("status") != "fail":
+            continue
+        critical = [
+            issue for issue in verdict.get("issues", [])
+            if issue.get("severity") == "critical" and issue.get("type") != "error"
+        ]
+        if critical:
+            failed[verdict.get("path")] = critical
+
+    files = [file for file in code["files"] if file["path"] in failed]
+    issues = [{"path": path, "issues": failed[path]} for path in failed]
+    return {"files": files}, issues
+
+
+def merge_files(code: dict, updates: dict) -> dict:
+    """
+    Merge updated files into code by path.
+    Existing files keep their position, new files are appended.
+    """
+    merged = {file["path"]: file for file in code["files"]}
+    for file in updates.get("files", []):
+        merged[file["path"]] = file
+    return {"files": list(merged.values())}
@@ -0,0 +1,69 @@
+from textwrap import dedent
+import hashlib
+
+# name -> PromptTemplate
+TEMPLATES = {}
+
+
+class PromptTemplate:
+    """
+    Static instructions for one agent role, sent as the system message.
+    The text never contains per-request values, so every call of the role
+    starts with the same bytes and providers can reuse their prompt cache.
+    Bump version whenever the text changes; cache keys include it.
+    """
+
+    def __init__(self, name: str, version: str, system: str):
+        self.name = name
+        self.version = version
+        self.system = dedent(system).strip()
+        self.digest = hashlib.sha256(self.system.encode("utf-8")).hexdigest()[:12]
+
+    def render(self, user: str) -> "Prompt":
+        return Prompt(self, user.strip())
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@{self.version}"
+
+
+class Prompt:
+    """
+    A rendered prompt: the template's system message plus a trailing user
+    message holding everything that varies between calls.
+    """
+
+    def __init__(self, template: PromptTemplate, user: str):
+        self.template = template
+        self.user = user
+
+    def messages(self) -> list:
+        return [
+            {"role": "system", "content": self.template.system},
+            {"role": "user", "content": self.user},
+        ]
+
+    def key_parts(self) -> tuple:
+        return (self.template.id, self.template.digest, self.user)
+
+    def __len__(self):
+        return len(self.template.system) + len(self.user)
+
+
+def template(name: str, version: str, system: str) -> PromptTemplate:
+    """
+    Register the template for a role; names must be unique.
+    """
+    if name in TEMPLATES:
+        raise ValueError(f"Prompt template already registered: {name}")
+    TEMPLATES[name] = PromptTemplate(name, version, system)
+    return TEMPLATES[name]
+
+
+def as_messages(prompt) -> list:
+    """
+    Chat messages for a Prompt, or a single system message for a plain string.
+    """
+    if isinstance(prompt, Prompt):
+        return prompt.messages()
+    return [{"role": "system", "content": prompt}]
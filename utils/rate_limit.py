@@ -0,0 +1,206 @@
+from contextlib import asynccontextmanager, nullcontext
+from pathlib import Path
+import asyncio
+import sqlite3
+import time
+
+
+def is_overload(error) -> bool:
+    """
+    True for provider throttling or server-side failures (429 / 5xx).
+    """
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units evenly over a minute.
+    A per_minute of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount=1):
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        # The lock keeps waiters in FIFO order
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+    async def adjust(self, amount):
+        """
+        Charge (or refund) the difference between estimated and actual usage.
+        The level may go negative, which delays later callers.
+        """
+        if not self.capacity:
+            return
+        self.refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose level lives in a SQLite (WAL) file, so every process
+    using the same path draws from one budget. SQLite is only touched
+    off the event loop; level is the value last read from the file,
+    which refill() extrapolates for reporting.
+    """
+
+    def __init__(self, name, per_minute, path):
+        super().__init__(per_minute)
+        self.name = name
+        self.path = Path(path)
+        if not self.capacity:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, level REAL, updated_at REAL)"
+            )
+            db.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                (name, float(per_minute), time.time()),
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _update(self, amount, take):
+        """
+        Refill, then subtract amount (if take, only when it is available).
+        Returns seconds to wait before amount is available, 0 if it was taken.
+        """
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            level, updated_at = db.execute(
+                "SELECT level, updated_at FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            level = min(self.capacity, level + (now - updated_at) * self.rate)
+            wait = 0
+            if take and level < amount:
+                wait = (amount - level) / self.rate
+            else:
+                level = min(self.capacity, level - amount)
+            db.execute(
+                "UPDATE buckets SET level = ?, updated_at = ? WHERE name = ?",
+                (level, now, self.name),
+            )
+            db.execute("COMMIT")
+            self.level = level
+            self.updated_at = time.monotonic()
+            return wait
+        finally:
+            db.close()
+
+    async def acquire(self, amount=1):
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                wait = await asyncio.to_thread(self._update, amount, True)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+    async def adjust(self, amount):
+        if self.capacity:
+            await asyncio.to_thread(self._update, amount, False)
+
+
+class ProviderLimiter:
+    """
+    Per-provider request/token buckets plus an AIMD concurrency window.
+    The window grows by 1/window on each success and halves on 429/5xx.
+    """
+
+    def __init__(self, provider, rpm=0, tpm=0, max_concurrency=32, min_concurrency=1, initial_concurrency=8, shared_path=None):
+        self.provider = provider
+        # With shared_path the rpm/tpm budgets are shared with other processes
+        if shared_path:
+            self.requests = SharedTokenBucket(f"{provider}:requests", rpm, shared_path)
+            self.tokens = SharedTokenBucket(f"{provider}:tokens", tpm, shared_path)
+        else:
+            self.requests = TokenBucket(rpm)
+            self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.window = float(min(initial_concurrency, max_concurrency))
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.counters = {"success": 0, "overload": 0, "error": 0}
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens=0, waiting=None):
+        """
+        Hold one concurrency slot for the duration of an LLM call.
+        Set usage["tokens"] inside the block to reconcile the token budget.
+        waiting: optional context manager entered while queued for the slot.
+        """
+        waiting = waiting if waiting is not None else nullcontext()
+        with waiting:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.in_flight < int(self.window))
+                self.in_flight += 1
+
+        usage = {"tokens": None}
+        outcome = "error"
+        try:
+            with waiting:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+            yield usage
+            outcome = "success"
+        except Exception as e:
+            outcome = "overload" if is_overload(e) else "error"
+            raise
+        finally:
+            try:
+                if usage["tokens"] is not None:
+                    await self.tokens.adjust(usage["tokens"] - estimated_tokens)
+            finally:
+                await self.release(outcome)
+
+    async def release(self, outcome):
+        self.counters[outcome] += 1
+        if outcome == "success":
+            self.window = min(self.max_concurrency, self.window + 1 / self.window)
+        elif outcome == "overload":
+            self.window = max(self.min_concurrency, self.window / 2)
+
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def state(self) -> dict:
+        self.requests.refill()
+        self.tokens.refill()
+        return {
+            "provider": self.provider,
+            "window": round(self.window, 2),
+            "inFlight": self.in_flight,
+            "requestsAvailable": round(self.requests.level, 2) if self.requests.capacity else None,
+            "tokensAvailable": round(self.tokens.level, 2) if self.tokens.capacity else None,
+            **self.counters,
+        }
@@ -0,0 +1,199 @@
+from collections import deque
+from contextvars import ContextVar
+from openai import APIConnectionError, APITimeoutError
+import asyncio
+import random
+import time
+
+from utils.rate_limit import is_overload
+
+
+class InvalidJSONError(ValueError):
+    """
+    The model answered, but not with parseable JSON.
+    """
+
+
+class TruncatedResponseError(InvalidJSONError):
+    """
+    The model hit max_tokens before finishing its JSON document.
+    """
+
+
+class Deadline:
+    """
+    Time budget for a call and its retries. The clock stops between
+    pause() and resume(), e.g. while waiting for a rate limiter slot.
+    Pauses may overlap (hedged calls); the clock runs again after the last.
+    """
+
+    def __init__(self, seconds):
+        self.loop = asyncio.get_running_loop()
+        self.end = self.loop.time() + seconds
+        self.pauses = 0
+        self.paused_at = None
+
+    def remaining(self) -> float:
+        now = self.paused_at if self.pauses else self.loop.time()
+        return max(0, self.end - now)
+
+    def pause(self):
+        if self.pauses == 0:
+            self.paused_at = self.loop.time()
+        self.pauses += 1
+
+    def resume(self):
+        self.pauses -= 1
+        if self.pauses == 0:
+            self.end += self.loop.time() - self.paused_at
+            self.paused_at = None
+
+    # "with deadline:" pauses it for the block
+    def __enter__(self):
+        self.pause()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.resume()
+
+
+_current_deadline = ContextVar("current_deadline", default=None)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+def is_retryable(error) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, APITimeoutError, APIConnectionError, InvalidJSONError)):
+        return True
+    return is_overload(error)
+
+
+def retry_after(error):
+    """
+    Seconds requested by a Retry-After header, if any.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retry transient failures with full-jitter exponential backoff.
+    `deadline` bounds the total time spent across all attempts, except
+    while an attempt has paused current_deadline().
+    """
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=20.0, deadline=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt, error=None) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        return delay
+
+    async def run(self, call, on_retry=None):
+        """
+        Await call() until it succeeds, a non-retryable error occurs,
+        attempts run out or the deadline passes.
+        on_retry(attempt, error) is called before each retry.
+        """
+        deadline = Deadline(self.deadline) if self.deadline else None
+        token = _current_deadline.set(deadline)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return await self.attempt(call, deadline)
+                except Exception as e:
+                    attempt += 1
+                    if attempt >= self.attempts or not is_retryable(e):
+                        raise
+                    delay = self.backoff(attempt, e)
+                    if deadline is not None and delay >= deadline.remaining():
+                        raise
+                    if on_retry is not None:
+                        on_retry(attempt, e)
+                    await asyncio.sleep(delay)
+        finally:
+            _current_deadline.reset(token)
+
+    async def attempt(self, call, deadline):
+        if deadline is None:
+            return await call()
+        # Like wait_for, but the deadline may move while the call runs
+        task = asyncio.ensure_future(call())
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=deadline.remaining())
+                if done:
+                    return task.result()
+                # While paused remaining() is frozen, so this just waits again
+                if not deadline.pauses and not deadline.remaining():
+                    raise asyncio.TimeoutError()
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+
+class Hedger:
+    """
+    Fire a duplicate call when the first one is slower than the observed
+    latency quantile, and keep whichever succeeds first.
+    """
+
+    def __init__(self, quantile=0.95, min_samples=20, window=200):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self.hedged = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def delay(self):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+    async def run(self, call):
+        delay = self.delay()
+        started_at = time.monotonic()
+        first = asyncio.create_task(call())
+        if delay is None:
+            result = await first
+            self.record(time.monotonic() - started_at)
+            return result
+
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedged += 1
+                pending.add(asyncio.create_task(call()))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.record(time.monotonic() - started_at)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,22 @@
+from pathlib import Path
+import os
+
+# Server processes; more than one needs state shared through STATE_DIR
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+# "local" keeps caches, limiter budgets and dedupe in each process;
+# "sqlite" shares them between processes through SQLite (WAL) files
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite" if SERVER_WORKERS > 1 else "local")
+STATE_DIR = Path(os.getenv("STATE_DIR", "workspace/state"))
+
+
+def is_shared() -> bool:
+    return STATE_BACKEND == "sqlite"
+
+
+def shared_state_path(name: str):
+    """
+    SQLite file for one piece of shared state, or None when state is local.
+    """
+    if not is_shared():
+        return None
+    return STATE_DIR / f"{name}.sqlite"
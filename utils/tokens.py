@@ -0,0 +1,117 @@
+import json
+import os
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
+
+# Context window (tokens) per provider's default models
+CONTEXT_WINDOWS = {
+    "deepseek": 64000,
+    "groq": 131072,
+    "gemini": 1000000,
+}
+
+# Completion budget per pipeline stage; override with LLM_MAX_TOKENS_<STAGE>
+STAGE_MAX_TOKENS = {
+    "specs": 2000,
+    "code": 8000,
+    # Batched reviews return several verdicts per call
+    "review": 2000,
+    "doc": 3000,
+}
+
+# Code tokens included in documentation prompts
+DOC_CODE_TOKENS = int(os.getenv("DOC_CODE_TOKENS", "12000"))
+
+# Head-room for chat formatting tokens the tokenizer does not see
+PROMPT_OVERHEAD = 64
+
+
+class PromptTooLargeError(ValueError):
+    pass
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with tiktoken when installed, else ~4 characters per token.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def context_window(provider: str) -> int:
+    return int(os.getenv(f"LLM_{provider.upper()}_CONTEXT_WINDOW", CONTEXT_WINDOWS.get(provider, 32000)))
+
+
+def max_output_tokens(stage):
+    if stage is None:
+        return None
+    default = STAGE_MAX_TOKENS.get(stage)
+    value = os.getenv(f"LLM_MAX_TOKENS_{stage.upper()}", default)
+    return int(value) if value else None
+
+
+def completion_budget(provider, stage, prompt_tokens) -> int:
+    """
+    max_tokens for a call: the stage budget, clipped to what the context
+    window has left after the prompt.
+    """
+    available = context_window(provider) - prompt_tokens - PROMPT_OVERHEAD
+    if available <= 0:
+        raise PromptTooLargeError(
+            f"Prompt of {prompt_tokens} tokens exceeds the {provider} context window"
+        )
+    budget = max_output_tokens(stage)
+    return min(budget, available) if budget else available
+
+
+def minify_code(content: str) -> str:
+    """
+    Strip trailing whitespace and collapse runs of blank lines.
+    Indentation is kept so the result is still valid source.
+    """
+    lines = [line.rstrip() for line in content.strip("\n").splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def compact_json(data) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def compact_files(files: list, budget=None) -> str:
+    """
+    Serialize [{"path", "content"}] as compact JSON with minified content.
+    With a token budget, files past it keep their path but lose their content.
+    """
+    compacted = []
+    used = 0
+    for file in files:
+        content = minify_code(file["content"])
+        cost = count_tokens(content)
+        if budget is not None and used + cost > budget:
+            content = "[omitted: over token budget]"
+        else:
+            used += cost
+        compacted.append({"path": file["path"], "content": content})
+    return compact_json({"files": compacted})
+
+
+def compact_issues(issues: list) -> str:
+    """
+    Keep only what a fix needs from [{"path", "issues": [...]}].
+    """
+    return compact_json([
+        {
+            "path": entry["path"],
+            "issues": [
+                {"line": issue.get("line"), "message": issue.get("message")}
+                for issue in entry["issues"]
+            ],
+        }
+        for entry in issues
+    ])
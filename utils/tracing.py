@@ -0,0 +1,218 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import asyncio
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Where finished spans go: "off", "memory" or "jsonl"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "off")
+TRACE_PATH = os.getenv("TRACE_PATH", "workspace/logs/traces.jsonl")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Numeric span attributes summed into counters for /metrics
+TOTALED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = None
+        self.start = time.time()
+        self.duration = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def increment(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """
+    Keeps finished spans in a list (for tests and debugging).
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span: dict):
+        self.spans.append(span)
+
+
+class JsonLinesExporter:
+    """
+    Appends one JSON object per finished span to a file. export() only puts
+    the span on a queue; a background thread does the file writes, so spans
+    finishing on the event loop never block on disk.
+    """
+
+    def __init__(self, path=TRACE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+        # Flush what is still queued when the process exits
+        atexit.register(self.close)
+
+    def export(self, span: dict):
+        self.queue.put(span)
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._write, name="trace-writer", daemon=True)
+                    self.thread.start()
+
+    def close(self):
+        """Write every queued span and stop the writer thread; export() restarts it."""
+        # Held while joining so a new writer never overlaps the old one
+        with self.lock:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+
+    def _write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                span = self.queue.get()
+                # Write everything already queued before flushing
+                while span is not None:
+                    f.write(json.dumps(span, default=str) + "\n")
+                    try:
+                        span = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                f.flush()
+                if span is None:
+                    return
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Tracer:
+    def __init__(self, exporters=None):
+        self.exporters = exporters or []
+        # span name -> Histogram of durations
+        self.histograms = {}
+        # span name -> number of failed spans
+        self.errors = {}
+        # (span name, attribute) -> sum over finished spans
+        self.totals = {}
+
+    def finish(self, span: Span):
+        self.histograms.setdefault(span.name, Histogram()).observe(span.duration)
+        if span.status == "error":
+            self.errors[span.name] = self.errors.get(span.name, 0) + 1
+        for attribute in TOTALED_ATTRIBUTES:
+            value = span.attributes.get(attribute)
+            if isinstance(value, (int, float)):
+                key = (span.name, attribute)
+                self.totals[key] = self.totals.get(key, 0) + value
+        if self.exporters:
+            data = span.to_dict()
+            for exporter in self.exporters:
+                exporter.export(data)
+
+    def close(self):
+        """Flush exporters that buffer spans (e.g. JsonLinesExporter)."""
+        for exporter in self.exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+
+    def render_metrics(self) -> str:
+        """
+        Span latency histograms and token totals in Prometheus text format.
+        """
+        lines = [
+            "# TYPE pipeline_span_duration_seconds histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'pipeline_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'pipeline_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'pipeline_span_duration_seconds_sum{{span="{name}"}} {histogram.sum:.6f}')
+            lines.append(f'pipeline_span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+        lines.append("# TYPE pipeline_span_errors_total counter")
+        for name, count in sorted(self.errors.items()):
+            lines.append(f'pipeline_span_errors_total{{span="{name}"}} {count}')
+        lines.append("# TYPE pipeline_span_attribute_total counter")
+        for (name, attribute), total in sorted(self.totals.items()):
+            lines.append(f'pipeline_span_attribute_total{{span="{name}",attribute="{attribute}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+def default_exporters():
+    if TRACE_EXPORT == "jsonl":
+        return [JsonLinesExporter(TRACE_PATH)]
+    if TRACE_EXPORT == "memory":
+        return [InMemoryExporter()]
+    return []
+
+
+tracer = Tracer(default_exporters())
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Open a span nested under the current one.
+    asyncio tasks inherit the span that was current when they were created.
+    """
+    current = Span(name, parent=_current_span.get(), **attributes)
+    token = _current_span.set(current)
+    started_at = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started_at
+        _current_span.reset(token)
+        tracer.finish(current)